@@ -8,21 +8,32 @@ is not necessarily true but would be expected during usual gameplay. It is curre
 hardcoded to allow for more realistic gameplay in the non-learning based simulations
 of the game.
 
+All randomness comes from a numpy Generator per agent, so games can be
+replayed by seeding them, see main.play_game. random_policy has the same
+behaviour, but decides for every seat of many games in a single vectorized
+call, returning the collated actions that env.step takes.
+
 @author: sggjone5
 """
 
-import random
+import numpy as np
+
 import parameters
+import team_tables
+
+# phase integers, matching AvalonEnv.phase_to_int
+PROPOSAL, VOTING, MISSION, ASSASSINATION, GAME_OVER, DISCUSSION = range(6)
 
 
 class agent():
     
-    def __init__(self, agent_idx, role, observation, secret_role_knowledge):
+    def __init__(self, agent_idx, role, observation, secret_role_knowledge, rng=None):
         
         self.agent_idx = agent_idx # this will be the agents player index
-        self.role = role # this will be the named role
+        self.role = role # this will be the role code, see parameters.role_names
         self.observation = observation # this will include histories
-        self.secret_role_knowledge = secret_role_knowledge # this will contain the names at the indexes that they know
+        self.secret_role_knowledge = secret_role_knowledge # this will contain the role codes at the indexes that they know
+        self.rng = rng if rng is not None else np.random.default_rng() # np.random.Generator for all decisions
         
         
         
@@ -33,7 +44,7 @@ class agent():
         
         action = [0] * observation['num_players']
         
-        selected_player_idx = random.sample(range(observation['num_players']), observation['mission_size'])
+        selected_player_idx = self.rng.permutation(observation['num_players'])[:observation['mission_size']]
         
         for i in selected_player_idx:
             action[i] = 1
@@ -41,42 +52,101 @@ class agent():
         return action
         
     
-    def select_action_voting(self, observation):
+    def select_action_discussion(self, observation):
         
-        # return a random reject or accept
+        # return a message of max_msg_len tokens, the random agent has
+        # nothing to say so it posts the empty message
         
-        action = random.sample([0,1], 1)
+        return np.zeros(observation['message_board'].shape[1], dtype=np.int32)
+    
+    def select_action_voting(self, observation):
         
+        # return a random reject or accept
         
-        return action[0]
+        return int(self.rng.random() < 0.5)
     
     def select_action_mission(self, observation):
         
         # if the player is evil
-        if self.role in parameters.evil_roles:
+        if parameters.is_evil[self.role]:
             
             # select randomly either pass or fail
-            action = random.sample([0,1], 1)
-            
+            return int(self.rng.random() < 0.5)
             
         # otherwise they are good, so they should vote pass   
-        else:
-            action = [0]
-
-        return action[0]
+        return 0
     
     def select_action_assassination(self, observation):
         
         # return a random person to assassinate
         action = [0] * observation['num_players'] 
         
-        selected_idx = random.randint(0,7)
+        selected_idx = self.rng.integers(0, observation['num_players'])
         
         action[selected_idx] = 1
         
         
         return action
+
+
+class random_policy():
+    """
+    The behaviour of agent for all the seats of many games at once.
+    
+    act takes the phase, either one phase integer or one per game, and
+    observations with a leading (num_envs,) axis. Public entries are
+    (num_envs, ...) and the seat entry 'role' is (num_envs, num_players),
+    each seat's own role code. It returns the (num_envs, num_players) int8
+    actions already collated for env.step.
+    """
+    
+    def __init__(self, num_players=8, rng=None):
+        
+        self.num_players = num_players
+        self.rng = rng if rng is not None else np.random.default_rng()
+        
+        # every team of every size, to draw proposals from
+        self.teams, self.team_counts = team_tables.teams_by_size(num_players, num_players)
+        
         
+    def act(self, phase, observations):
         
+        role = observations['role']
+        num_envs = role.shape[0]
+        
+        phase = np.broadcast_to(phase, (num_envs,))
+        actions = np.zeros((num_envs, self.num_players), dtype=np.int8)
+        
+        # the leader proposes a random team of the mission size, drawn
+        # uniformly from the team table of that size
+        proposal = phase == PROPOSAL
+        if proposal.any():
+            
+            sizes = observations['mission_size'][proposal]
+            team_idxs = (self.rng.random(len(sizes)) * self.team_counts[sizes]).astype(np.intp)
+            actions[proposal] = self.teams[sizes, team_idxs]
         
-        
\ No newline at end of file
+        # every player votes to accept or reject at random
+        voting = phase == VOTING
+        if voting.any():
+            
+            actions[voting] = self.rng.integers(0, 2, (voting.sum(), self.num_players))
+        
+        # evil players on the team fail at random, good players always pass
+        mission = phase == MISSION
+        if mission.any():
+            
+            fails = (self.rng.random((mission.sum(), self.num_players)) < 0.5)
+            fails &= parameters.is_evil[role[mission]]
+            fails &= observations['proposed_team'][mission] == 1
+            actions[mission] = fails
+        
+        # the assassin picks a random player to assassinate
+        assassination = phase == ASSASSINATION
+        if assassination.any():
+            
+            targets = self.rng.integers(0, self.num_players, assassination.sum())
+            actions[np.flatnonzero(assassination), targets] = 1
+            
+        return actions
+
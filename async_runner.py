@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+An asyncio runner for games between slow, latency bound agents.
+
+Agents which wait on something slow, such as an LLM generating discussion,
+would block every other game in the synchronous loop of main.py. Here an
+agent's select_action_* methods can be coroutines instead, and many games
+are interleaved on one event loop, so while one agent waits on its model
+call every other game keeps progressing. Plain agents.agent methods can be
+mixed in, they are simply called without awaiting.
+
+    timeout         - seconds an agent call may take before it is cancelled
+                      and the random agent behaviour decides instead
+    max_concurrency - agent calls allowed in flight at once across every
+                      game, such as a model server's rate limit
+    games_in_flight - games played at once, each with its own AvalonEnv
+    env_kwargs      - passed to every AvalonEnv, such as num_players
+
+latency_agent is a local stand in for a model backed agent, the random
+agent behaviour after an artificial delay, so the runner can be tested
+offline. For example
+
+    python async_runner.py --games 1000 --latency 0.05 --timeout 0.08
+
+@author: sggjone5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import inspect
+import time
+
+import numpy as np
+
+from avalon_env import AvalonEnv
+from agents import agent
+import main
+
+
+class latency_agent(agent):
+    """
+    The random agent behaviour, returned after sleeping for latency seconds
+    varied by up to jitter of itself either way.
+    """
+
+    def __init__(self, agent_idx, role, observation, secret_role_knowledge, rng=None, latency=0.05, jitter=0.5):
+
+        super().__init__(agent_idx, role, observation, secret_role_knowledge, rng)
+
+        self.latency = latency
+        self.jitter = jitter
+
+
+    async def _wait(self):
+        await asyncio.sleep(self.latency * (1 + self.jitter * (2 * self.rng.random() - 1)))
+
+
+    async def select_action_proposal(self, observation):
+        await self._wait()
+        return super().select_action_proposal(observation)
+
+
+    async def select_action_discussion(self, observation):
+        await self._wait()
+        return super().select_action_discussion(observation)
+
+
+    async def select_action_voting(self, observation):
+        await self._wait()
+        return super().select_action_voting(observation)
+
+
+    async def select_action_mission(self, observation):
+        await self._wait()
+        return super().select_action_mission(observation)
+
+
+    async def select_action_assassination(self, observation):
+        await self._wait()
+        return super().select_action_assassination(observation)
+
+
+def latency_agents(latency=0.05, jitter=0.5):
+    """
+    A make_agents function creating a latency_agent for every seat.
+    """
+    def make_agents(env, observation, rng):
+        return [latency_agent(i, env.roles[i], observation, env.secret_info[i], rng, latency, jitter)
+                for i in env.agents]
+
+    return make_agents
+
+
+class AsyncRunner():
+    """
+    Plays games between agents with coroutine decisions, interleaved on one
+    event loop.
+
+    make_agents(env, observation, rng) returns the agent of every seat for
+    a newly reset env.
+    """
+
+    def __init__(self, make_agents=None, timeout=None, max_concurrency=None, games_in_flight=256, env_kwargs=None):
+
+        self.make_agents = make_agents if make_agents is not None else latency_agents()
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.games_in_flight = games_in_flight
+        self.env_kwargs = env_kwargs if env_kwargs is not None else {}
+
+        self.decisions = 0
+        self.timeouts = 0
+
+        # created in run, inside the event loop
+        self.semaphore = None
+
+
+    async def decide(self, player, fallback, method, observation):
+        """
+        One agent decision, awaited under the concurrency limit and timeout
+        if it is a coroutine. A timed out decision is made by fallback.
+        """
+        self.decisions += 1
+
+        async with self.semaphore if self.semaphore is not None else contextlib.nullcontext():
+
+            result = getattr(player, method)(observation)
+
+            if not inspect.isawaitable(result):
+                return result
+
+            try:
+                return await asyncio.wait_for(result, self.timeout)
+
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return getattr(fallback, method)(observation)
+
+
+    async def select_action(self, env, player_models, fallbacks, observation):
+        """
+        main.select_action, with the decisions of every acting seat awaited
+        together.
+        """
+        if env.phase == 'proposal':
+
+            leader = env.leader
+            return np.array(await self.decide(player_models[leader], fallbacks[leader],
+                                              'select_action_proposal', observation))
+
+        elif env.phase == 'discussion':
+
+            return np.array(await asyncio.gather(*[
+                self.decide(player_models[i], fallbacks[i], 'select_action_discussion', observation)
+                for i in env.agents]))
+
+        elif env.phase == 'voting':
+
+            return np.array(await asyncio.gather(*[
+                self.decide(player_models[i], fallbacks[i], 'select_action_voting', observation)
+                for i in env.agents]))
+
+        elif env.phase == 'mission':
+
+            actions = np.zeros(env.num_players, dtype=np.int8) # always vote pass if not on the team
+
+            team = np.flatnonzero(observation['proposed_team'] == 1)
+            actions[team] = await asyncio.gather(*[
+                self.decide(player_models[i], fallbacks[i], 'select_action_mission', observation)
+                for i in team])
+
+            return actions
+
+        elif env.phase == 'assassination':
+
+            assassin = env.assassin_idx
+            return np.array(await self.decide(player_models[assassin], fallbacks[assassin],
+                                              'select_action_assassination', observation))
+
+        # the game is over, the action is ignored
+        return np.zeros(env.num_players, dtype=np.int8)
+
+
+    async def play_game(self, env, seed=None):
+        """
+        main.play_game with coroutine agents, returning the same results.
+        """
+        env_seed, agents_seed = main.spawn_seeds(seed, 2)
+        agents_rng = np.random.default_rng(agents_seed)
+
+        observation, _ = env.reset(seed=int(env_seed.generate_state(1)[0]))
+
+        player_models = self.make_agents(env, observation, agents_rng)
+
+        # the random agent behaviour decides for any seat that times out
+        fallbacks = [agent(i, env.roles[i], observation, env.secret_info[i], rng=agents_rng) for i in env.agents]
+
+        while env.dones == False:
+
+            action = await self.select_action(env, player_models, fallbacks, observation)
+
+            observation, reward, terminated, truncated, info = env.step(action)
+
+        win_condition = main.get_win_condition(env)
+
+        return win_condition != main.GOOD_WIN, win_condition, env.roles.copy(), env.successful_missions + env.failed_missions
+
+
+    async def run(self, num_games, seed=None):
+        """
+        Play num_games games, games_in_flight at a time, returning the
+        evil wins and win condition of every game in order.
+        """
+        if self.max_concurrency is not None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        game_seeds = main.spawn_seeds(seed, num_games)
+
+        evil_wins = np.zeros(num_games, dtype=bool)
+        win_condition = np.zeros(num_games, dtype=np.int8)
+
+        next_game = 0
+
+        async def worker():
+            nonlocal next_game
+
+            # the agents only read the observation, so it does not need copying
+            env = AvalonEnv(**{'render_mode': None, **self.env_kwargs, 'copy_obs': False})
+
+            while next_game < num_games:
+                game = next_game
+                next_game += 1
+
+                evil_wins[game], win_condition[game], _, _ = await self.play_game(env, game_seeds[game])
+
+        await asyncio.gather(*[worker() for _ in range(min(self.games_in_flight, num_games))])
+
+        return evil_wins, win_condition
+
+
+def run_games(num_games, seed=None, **kwargs):
+    """
+    Run an AsyncRunner, built from kwargs, for num_games games on a new event
+    loop, returning a summary of the results.
+    """
+    runner = AsyncRunner(**kwargs)
+
+    start = time.perf_counter()
+    evil_wins, win_condition = asyncio.run(runner.run(num_games, seed))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'games': num_games,
+        'seconds': elapsed,
+        'games_per_second': num_games / elapsed,
+        'decisions': runner.decisions,
+        'timeouts': runner.timeouts,
+        'evil_win_rate': evil_wins.mean(),
+        'win_rate_by_condition': {name: np.mean(win_condition == code)
+                                  for code, name in enumerate(main.win_conditions)},
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Play games of Avalon between slow agents on one event loop.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--games-in-flight', type=int, default=256)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean seconds per agent decision')
+    parser.add_argument('--jitter', type=float, default=0.5, help='fraction the latency varies by')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds before a decision falls back to random')
+    parser.add_argument('--max-concurrency', type=int, default=None, help='agent calls in flight at once')
+    parser.add_argument('--players', type=int, default=8, help='number of players, 5 to 10')
+    parser.add_argument('--discussion', action='store_true', help='play a discussion phase after every proposal')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    results = run_games(args.games, seed=args.seed, make_agents=latency_agents(args.latency, args.jitter),
+                        timeout=args.timeout, max_concurrency=args.max_concurrency,
+                        games_in_flight=args.games_in_flight, env_kwargs={'num_players': args.players, 'discussion': args.discussion})
+
+    print(f"Games: {results['games']} in {results['seconds']:.2f}s ({results['games_per_second']:.1f} games/s)")
+    print(f"Decisions: {results['decisions']}, timed out: {results['timeouts']}")
+    print(f"Evil win rate: {results['evil_win_rate']:.3f}")
+
+    for name, rate in results['win_rate_by_condition'].items():
+        print(f"  {name}: {rate:.3f}")
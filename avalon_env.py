@@ -2,7 +2,8 @@
 """
 
 A custom gymnasium environment that simualates an 8 player setup of the Avalon 
-board game.
+board game. Any official player count from 5 to 10 can be played instead,
+see rules.py for the mission sizes and roles of each.
 
 Full game rules can be found here: 
 
@@ -22,55 +23,157 @@ Players included are:
     Assassin - knows other evil players, except Mordred
     Minion - knows other evil players, except Mordred
 
+With discussion=True a 'discussion' phase is played after every proposal,
+before the vote. Each seat posts a message of max_msg_len integer tokens
+from a vocabulary of vocab_size, token 0 meaning nothing said, as one
+(num_players, max_msg_len) action. The latest messages are kept on the
+message board, and every discussion is also written into a ring buffer of
+the last message_history boards, with message_cursor the slot the next one
+goes into. Both are read only views in the observation.
+
+With game_log=True every proposal is also appended to a game_log.GameLog,
+with its round, leader, votes and mission fails, so rejected proposals are
+kept too. The dict observation then holds read only views of a window of
+25 of its rows, log_round, log_leader, log_team, log_votes and log_fails,
+the first 25 proposals and then the latest 25, with log_length of them
+logged so far and the rest empty. The views are only replaced when a
+proposal is made, and the full log is kept in env.game_log. The flat
+observation leaves the log out.
+
 @author: sggjone5
 """
 
 import numpy as np
-import random
 
 import gymnasium as gym
 from gymnasium import spaces
 
 from stable_baselines3.common.env_checker import check_env
 
+import event_trace
+import parameters
+import rules
+from obs_encoding import get_layout
+from game_log import GameLog, default_capacity as game_log_window
+
+class AvalonSnapshot():
+    """
+    The minimal mutable game state of an AvalonEnv, with its arrays
+    preallocated so the same snapshot can be reused for every clone.
+    
+    The role lookups are only replaced, never changed in place, when roles
+    are set, so the snapshot keeps references to them rather than copies.
+    """
+    
+    __slots__ = ('phase', 'rendering_phase', 'current_round', 'leader',
+                 'successful_missions', 'failed_missions', 'assassin_kill', 'dones',
+                 'rewards', 'current_mission_actions', 'proposed_team', 'votes',
+                 'votes_history', 'mission_history', 'roles', 'role_lookups',
+                 'message_board', 'message_history', 'message_count', 'game_log')
+    
+    def __init__(self, env):
+        
+        self.proposed_team = env.proposed_team.copy()
+        self.votes = env.votes.copy()
+        self.votes_history = env.votes_history.copy()
+        self.mission_history = env.mission_history.copy()
+        self.roles = env.roles.copy()
+        
+        # the message board only exists with a discussion phase
+        if env.discussion:
+            self.message_board = env.message_board.copy()
+            self.message_history = env.message_history.copy()
+        
+        # the game log only exists with game_log=True, and is copied into a
+        # log of its own
+        self.game_log = GameLog(env.num_players, env.game_log.capacity) if env.game_log is not None else None
+        
+
 class AvalonEnv(gym.Env):
     """
     A custom gymnasium environment that simulates the Avalon board game.
     """
-    metadata = {'render.modes': ['human']}
+    metadata = {'render_modes': ['human', 'ansi']}
 
-    def __init__(self, num_players=8):
+    def __init__(self, num_players=8, render_mode=None, trace=None, copy_obs=True,
+                 obs_mode='dict', obs_dtype=np.float32, discussion=False, max_msg_len=8,
+                 message_history=8, vocab_size=32, profiler=None, obs_buffer=None, game_log=False):
         super().__init__()
         self.num_players = num_players
+        
+        # optional discussion phase between proposal and voting, where every
+        # seat posts a message of max_msg_len tokens
+        self.discussion = discussion
+        self.max_msg_len = max_msg_len
+        self.message_history_len = message_history
+        self.vocab_size = vocab_size
+        
+        # None for no rendering, 'human' to print every step or 'ansi' to
+        # return the rendered text from render()
+        if render_mode is not None and render_mode not in self.metadata['render_modes']:
+            raise ValueError(f'Invalid render mode {render_mode}.')
+        self.render_mode = render_mode
+        
+        # optional event_trace.EventTrace to record every step into
+        self.trace = trace
+        
+        # optional instrumentation.StepProfiler to time every step with
+        self.profiler = profiler
+        
+        # if True every observation returned is a new copy, otherwise the
+        # same read only observation is returned and updated in place
+        self.copy_obs = copy_obs
+        
+        # 'dict' for the spaces.Dict observation, or 'flat' for a single
+        # vector laid out by obs_encoding.ObsLayout
+        if obs_mode not in ('dict', 'flat'):
+            raise ValueError(f'Invalid observation mode {obs_mode}.')
+        self.obs_mode = obs_mode
         self.num_rounds = 5
         self.current_round = 0
         self.leader = 0  # Index of the current leader
         
-        self.mission_history = np.zeros(self.num_rounds) # need to be wary of default 0
+        self.mission_history = np.zeros(self.num_rounds, dtype=np.int8) # need to be wary of default 0
         
         self.successful_missions = 0
         self.failed_missions = 0
         
         # Phases: 'proposal', 'voting', 'mission', 'assassination', 'game_over'
+        # and 'discussion' if it is played
         self.phase = 'proposal'  
+        self.num_phases = len(self.phase_dict) if discussion else len(self.phase_dict) - 1
         self.rendering_phase = 'proposal'
 
-        # Define mission sizes for each round (standard for 8 players)
-        self.mission_sizes = [3, 4, 4, 5, 5]
+        # the rules of this player count, and every lookup derived from them,
+        # compiled once and shared between all envs of the same size
+        self.rules = rules.get_rules(num_players)
 
-        # For Mission 4, two fails are required to fail the mission
-        self.two_fails_required_round = 3  # zero-indexed
+        # mission sizes for each round
+        self.mission_sizes = self.rules.mission_sizes
+
+        # from 7 players, Mission 4 needs two fails to fail, otherwise None
+        self.two_fails_required_round = self.rules.two_fails_required_round
 
         # agents indexes to use for initialising agents
         self.agents = [i for i in range(self.num_players)]  # all players in the game
+        self.agent_names = ['player_' + str(idx) for idx in self.agents]
        
-        # Assign roles
-        self.roles = np.zeros(self.num_players, dtype=object)
+        # Assign roles, stored as parameters role codes
+        self.roles = np.zeros(self.num_players, dtype=np.int8)
         self.assign_roles()
         
+        # every legal team of each round's mission size, shared between envs.
+        # A Discrete proposal action is an index into the current round's table
+        self.team_tables = self.rules.team_tables
+        self.proposal_masks = self.rules.proposal_masks
+        self.proposal_action_space = self.rules.proposal_action_space
+        
         # boolean of assassin success
         self.assassin_kill = False
 
+        # the private observation of each player, their secret knowledge
+        self.private_observation_space = self.rules.private_observation_space
+        
         # initalise action and observation spaces for an individual agent
         proposal_actions = spaces.MultiBinary(self.num_players) # 0 not selected, 1 selected
         voting_actions = spaces.Discrete(2) # 0 reject, 1 accept
@@ -81,66 +184,146 @@ class AvalonEnv(gym.Env):
         # of the game, if using one agent across all four phases.
         # most likely do 8 * 4 length action space and look into action masking?
         
-        total_action_space_length = self.num_players + 1 + 1 + self.num_players
+        # num_players + 1 + 1 + num_players long, shared with the rules
+        self.action_space = self.rules.action_space
+        
+        # the per field spaces are shared, only the Dict is built per env
+        self.observation_space = spaces.Dict({'phase': spaces.Discrete(self.num_phases),
+                                              **self.rules.observation_spaces})
+        
+        if discussion:
+            self.discussion_action_space = spaces.Box(low=0, high=vocab_size - 1, shape=(num_players, max_msg_len),
+                                                      dtype=np.int32)
+            self.observation_space['message_board'] = self.discussion_action_space
+            self.observation_space['message_history'] = spaces.Box(
+                low=0, high=vocab_size - 1, shape=(message_history, num_players, max_msg_len), dtype=np.int32)
+            self.observation_space['message_cursor'] = spaces.Discrete(message_history)
+        
+        if game_log:
+            for name, space in self.rules.log_observation_spaces.items():
+                self.observation_space[name] = space
+        
+        # the flat layout is computed once, and its vector updated in place
+        if self.obs_mode == 'flat':
+            self.obs_layout = get_layout(self.num_players, self.num_rounds, self.rules.max_mission_size, self.num_phases,
+                                         max_msg_len if discussion else 0, message_history, vocab_size)
+            self.observation_space = self.obs_layout.space(obs_dtype)
+            
+            # obs_buffer is an optional array to encode into instead, such as
+            # a row of shared memory which other processes read
+            if obs_buffer is None:
+                self.flat_observation = np.zeros(self.obs_layout.size, dtype=obs_dtype)
+            elif obs_buffer.shape != (self.obs_layout.size,) or obs_buffer.dtype != obs_dtype:
+                raise ValueError(f'obs_buffer must be a {np.dtype(obs_dtype)} array of shape ({self.obs_layout.size},).')
+            else:
+                self.flat_observation = obs_buffer
+            self.flat_observation_view = self._read_only(self.flat_observation)
         
-        self.action_space = spaces.MultiBinary(total_action_space_length)
+        # game state arrays, allocated once and only ever updated in place
+        self.proposed_team = np.zeros(self.num_players, dtype=np.int8)
+        self.votes = np.zeros(self.num_players, dtype=np.int8)
+        self.votes_history = np.zeros((self.num_rounds, self.num_players), dtype=np.int8)
         
-        self.observation_space = spaces.Dict({
-            'phase': spaces.Discrete(5),
-            'current_round': spaces.Discrete(self.num_rounds),
-            'leader': spaces.Discrete(self.num_players),
-            'proposed_team': spaces.MultiBinary(self.num_players),
-            'votes': spaces.MultiBinary(self.num_players),
-            'votes_history': spaces.MultiBinary((self.num_rounds, self.num_players)),
-            'mission_history': spaces.MultiBinary(self.num_rounds),
-            'successful_missions': spaces.Discrete(self.num_rounds + 1),
-            'failed_missions': spaces.Discrete(self.num_rounds + 1),
-            'num_players': spaces.Discrete(self.num_players + 1),
-            'mission_size': spaces.Discrete(max(self.mission_sizes)+1)
-        })
+        # the observation is built once, the arrays in it are read only views
+        # of the game state so only the scalar entries need updating per step
+        self.observation = {
+                'phase': 0,
+                'current_round': 0,
+                'leader': 0,
+                'proposed_team': self._read_only(self.proposed_team),
+                'votes': self._read_only(self.votes),
+                'votes_history' : self._read_only(self.votes_history),
+                'mission_history': self._read_only(self.mission_history),
+                'successful_missions': 0,
+                'failed_missions': 0,
+                'num_players': self.num_players,
+                'mission_size': 0
+            }
+        
+        # the message board and its ring buffered history, written in place
+        if discussion:
+            self.message_board = np.zeros((num_players, max_msg_len), dtype=np.int32)
+            self.message_history = np.zeros((message_history, num_players, max_msg_len), dtype=np.int32)
+            self.message_count = 0
+            
+            self.observation['message_board'] = self._read_only(self.message_board)
+            self.observation['message_history'] = self._read_only(self.message_history)
+            self.observation['message_cursor'] = 0
+        
+        # optional log of every proposal, appended to in place
+        self.game_log = GameLog(num_players) if game_log else None
+        
+        # cached action masks, see action_masks. The mission mask is a bool
+        # view of the proposed team, so it never needs updating
+        self.voting_mask = self._read_only(np.ones(self.num_players, dtype=bool))
+        self.mission_mask = self._read_only(self.proposed_team.view(bool))
         
         self.dones = False # determines whether the game is over or not
         self.info = {}
         self.truncated = {}
         self.reset()
+        
+    @staticmethod
+    def _read_only(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+    
+    def _refresh_log_window(self):
+        """
+        Point the observation at the game log's window, which moves on, and
+        is replaced if the log grows, with every proposal.
+        """
+        for name, view in self.game_log.window(game_log_window).items():
+            self.observation['log_' + name] = view
+        
+        self.observation['log_length'] = min(self.game_log.length, game_log_window)
 
     def assign_roles(self):
         """
-        Randomly assign specific roles to players.
+        Randomly assign specific roles to players, drawn from the env's
+        np_random Generator.
         """
-        roles_list = [
-            'Merlin',      # Good
-            'Percival',    # Good
-            'Loyal Servant',  # Good
-            'Loyal Servant',  # Good
-            'Loyal Servant',  # Good
-            'Assassin',    # Evil
-            'Mordred',     # Evil
-            'Minion',      # Evil
-        ]
-        random.shuffle(roles_list)
-        self.roles = np.array(roles_list)
+        self.set_roles(parameters.draw_roles(self.np_random, 1, self.rules.roles)[0])
         
-        self.assassin_idx = np.where( self.roles == 'Assassin')[0][0]
-
-        # Creating the mappings
-        self.good_roles = ['Merlin', 'Percival', 'Loyal Servant']
-        self.evil_roles = ['Assassin', 'Mordred', 'Minion']
-
-        # Determine who knows whose identity
-        self.information = {}
+    def set_roles(self, roles):
+        """
+        Set the role codes of every player, and cache the lookups on them.
+        """
+        self.roles[:] = roles
+        
+        # cache the role lookups used during the game
+        self.merlin_idx = int(np.argmax(self.roles == parameters.MERLIN))
+        self.assassin_idx = int(np.argmax(self.roles == parameters.ASSASSIN))
+        
+        self.evil_mask = parameters.is_evil[self.roles]
+        self.good_mask = ~self.evil_mask
+        
+        # what each player knows about the others, computed once per game.
+        # secret_knowledge[i, j] is the one hot role of player j if player i
+        # knows it, and secret_info[i, j] is that role code or -1
+        self.secret_knowledge = parameters.secret_knowledge(self.roles)
+        self.secret_info = np.where(self.secret_knowledge.any(axis=2),
+                                    self.secret_knowledge.argmax(axis=2), -1).astype(np.int8)
+        
+        # the assassin can target anyone but themselves
+        self.assassination_mask = self._read_only(np.arange(self.num_players) != self.assassin_idx)
         
 
-    def reset(self, seed = 0):
+    def reset(self, seed=None, options=None):
         """
-        Reset the environment to the initial state.
+        Reset the environment to the initial state. Passing a seed reseeds
+        the env's np_random Generator, which all of the env's randomness
+        comes from, so the same seed always deals the same game.
         """
+        super().reset(seed=seed)
+        
         # reset the round and the leader
         self.current_round = 0
         self.leader = 0
         
         # Reset mission and votes history
-        self.mission_history = np.zeros(self.num_rounds, dtype=np.int8)
+        self.mission_history.fill(0)
         
         
         # reset counts of successful and failed missions
@@ -152,96 +335,210 @@ class AvalonEnv(gym.Env):
         self.rendering_phase = 'proposal'
         
         # reset proposed team and votes to prepare for new proposal
-        self.proposed_team = np.zeros(self.num_players, dtype=np.int8)
-        self.votes = np.zeros(self.num_players, dtype=np.int8)
-        self.votes_history = np.zeros((self.num_rounds, self.num_players), dtype=np.int8)
+        self.proposed_team.fill(0)
+        self.votes.fill(0)
+        self.votes_history.fill(0)
         
-        # reassign roles for each platey
-        self.assign_roles()
-    
-        # reset the observvations for an agent
-        self.observation = {
-                'phase': self.phase_to_int(self.phase),
-                'current_round': self.current_round,
-                'leader': self.leader,
-                'proposed_team': self.proposed_team.copy(),
-                'votes': self.votes.copy(),
-                'votes_history' : self.votes_history.copy(),
-                'mission_history': self.mission_history.copy(),
-                'successful_missions': self.successful_missions,
-                'failed_missions': self.failed_missions,
-                'num_players': self.num_players,
-                'mission_size': self.mission_sizes[self.current_round]
-            }
+        if self.discussion:
+            self.message_board.fill(0)
+            self.message_history.fill(0)
+            self.message_count = 0
         
+        if self.game_log is not None:
+            self.game_log.clear()
+            self._refresh_log_window()
         
+        # reset the end of game state
+        self.dones = False
+        self.assassin_kill = False
         
+        # reassign roles for each platey
+        self.assign_roles()
+        
+        if self.trace is not None:
+            self.trace.new_game()
+    
         self.info = {}
         self.rewards = {}
     
         
-        return self.observation, self.info
+        return self._get_observation(), self.info
 
-    def _get_secret_info(self, agent_name):
+    # role lookups cached by set_roles, which snapshots keep references to
+    role_lookups = ('merlin_idx', 'assassin_idx', 'evil_mask', 'good_mask',
+                    'secret_knowledge', 'secret_info', 'assassination_mask')
+    
+    def clone_state(self, snapshot=None):
         """
-        Returns the secret information of the game, tailored to the player role.
-        
-        There will be a better way to encode this information, but for now it is 
-        returned as a list of equal length to the amount of players, where the
-        known player identities are in the index of that player. For example,
-        if you know the Assassin's identity and they are at index 0
-        
-        ['Assassin', '', '', '', ..., '']
+        Save the game state into snapshot, or a new AvalonSnapshot if none is
+        given, and return it. Reusing a snapshot allocates no arrays.
+        """
+        if snapshot is None:
+            snapshot = AvalonSnapshot(self)
+            
+        snapshot.phase = self.phase
+        snapshot.rendering_phase = self.rendering_phase
+        snapshot.current_round = self.current_round
+        snapshot.leader = self.leader
+        snapshot.successful_missions = self.successful_missions
+        snapshot.failed_missions = self.failed_missions
+        snapshot.assassin_kill = self.assassin_kill
+        snapshot.dones = self.dones
+        snapshot.rewards = self.rewards
+        snapshot.current_mission_actions = getattr(self, 'current_mission_actions', None)
+        
+        np.copyto(snapshot.proposed_team, self.proposed_team)
+        np.copyto(snapshot.votes, self.votes)
+        np.copyto(snapshot.votes_history, self.votes_history)
+        np.copyto(snapshot.mission_history, self.mission_history)
+        np.copyto(snapshot.roles, self.roles)
+        
+        if self.discussion:
+            np.copyto(snapshot.message_board, self.message_board)
+            np.copyto(snapshot.message_history, self.message_history)
+            snapshot.message_count = self.message_count
+        
+        if self.game_log is not None:
+            snapshot.game_log.copy_from(self.game_log)
+        
+        snapshot.role_lookups = [getattr(self, name) for name in self.role_lookups]
+        
+        return snapshot
+    
+    def restore_state(self, snapshot):
         """
+        Restore the game state saved by clone_state, in place.
+        """
+        self.phase = snapshot.phase
+        self.rendering_phase = snapshot.rendering_phase
+        self.current_round = snapshot.current_round
+        self.leader = snapshot.leader
+        self.successful_missions = snapshot.successful_missions
+        self.failed_missions = snapshot.failed_missions
+        self.assassin_kill = snapshot.assassin_kill
+        self.dones = snapshot.dones
+        self.rewards = snapshot.rewards
+        self.current_mission_actions = snapshot.current_mission_actions
+        
+        np.copyto(self.proposed_team, snapshot.proposed_team)
+        np.copyto(self.votes, snapshot.votes)
+        np.copyto(self.votes_history, snapshot.votes_history)
+        np.copyto(self.mission_history, snapshot.mission_history)
+        np.copyto(self.roles, snapshot.roles)
+        
+        if self.discussion:
+            np.copyto(self.message_board, snapshot.message_board)
+            np.copyto(self.message_history, snapshot.message_history)
+            self.message_count = snapshot.message_count
+        
+        if self.game_log is not None:
+            self.game_log.copy_from(snapshot.game_log)
+            self._refresh_log_window()
+        
+        for name, value in zip(self.role_lookups, snapshot.role_lookups):
+            setattr(self, name, value)
+    
+    def action_masks(self):
+        """
+        The cached mask of legal actions in the current phase, so learners
+        never need to sample an illegal one.
+        
+        - proposal
+            (max_teams,) legal Discrete proposal actions for this round
+        - voting
+            (num_players,) all players vote
+        - mission
+            (num_players,) only players on the proposed team take an action
+        - assassination
+            (num_players,) legal targets, everyone except the assassin
+        - discussion
+            (num_players,) every player posts a message
+            
+        After the game is over any action is ignored, and the voting mask
+        is returned.
+        """
+        if self.phase == 'proposal':
+            return self.proposal_masks[self.current_round]
         
-        secret_knowledge = [''] * self.num_players
+        elif self.phase == 'mission':
+            return self.mission_mask
+        
+        elif self.phase == 'assassination':
+            return self.assassination_mask
         
-        # Merlin knows all evil except Mordred
-        if agent_name == 'Merlin':
- 
-            evil_idxs = np.where((self.roles == 'Assassin') | (self.roles == 'Minion'))[0]
+        return self.voting_mask
     
-            # Set the names 'Assassin' or 'Minion' at those indices
-            for idx in evil_idxs:
-                secret_knowledge[idx] = self.roles[idx]
-            
-            
-        if agent_name == 'Percival':
-            
-            merlin_idx = np.where(self.roles == 'Merlin')[0][0]
-            
-            secret_knowledge[merlin_idx] = 'Merlin'
-            
+    def _get_secret_info(self, player_idx):
+        """
+        Returns the secret information of the game, tailored to the player at
+        player_idx. It is looked up by seat rather than by role, as some roles
+        such as the Minion can be held by more than one player.
         
+        It is returned as an array of role codes of equal length to the amount
+        of players, where the known player roles are in the index of that
+        player and unknown players are -1. For example, if you know the
+        Assassin's identity and they are at index 0
         
-        if agent_name == 'Assassin':
-            
-            minion_idx = np.where(self.roles == 'Minion')[0][0]
-            
-            secret_knowledge[minion_idx] = 'Minion'
-            
+        [ASSASSIN, -1, -1, -1, ..., -1]
         
-        if agent_name == 'Minion':
-            
-            assassin_idx = np.where(self.roles == 'Assassin')[0][0]
-            
-            secret_knowledge[assassin_idx] = 'Assassin'
-            
-            
-        return secret_knowledge  
-   
+        parameters.decode_roles turns the known codes back into names.
+        """
+        return self.secret_info[player_idx]
+    
+    def private_observation(self, player_idx):
+        """
+        The compact one hot secret knowledge of a player, flattened to
+        (num_players * num_role_codes,) to be added to their observation.
+        """
+        return self.secret_knowledge[player_idx].reshape(-1)
+
 
 
+    phase_dict = {
+        'proposal': 0,
+        'voting': 1,
+        'mission': 2,
+        'assassination': 3,
+        'game_over': 4,
+        'discussion': 5,
+    }
+
+    phase_names = list(phase_dict)
 
     def phase_to_int(self, phase):
-        phase_dict = {
-            'proposal': 0,
-            'voting': 1,
-            'mission': 2,
-            'assassination': 3,
-            'game_over': 4,
-        }
-        return phase_dict[phase]
+        return self.phase_dict[phase]
+    
+    def _get_observation(self):
+        """
+        Update the scalar entries of the observation in place, and return
+        either the observation itself or a copy of it. In 'flat' mode the
+        flat vector is encoded in place from it instead.
+        """
+        observation = self.observation
+        
+        observation['phase'] = self.phase_dict[self.phase]
+        observation['current_round'] = self.current_round
+        observation['leader'] = self.leader
+        observation['successful_missions'] = self.successful_missions
+        observation['failed_missions'] = self.failed_missions
+        observation['mission_size'] = self.mission_sizes[self.current_round]
+        
+        if self.discussion:
+            observation['message_cursor'] = self.message_count % self.message_history_len
+        
+        if self.obs_mode == 'flat':
+            self.obs_layout.encode(observation, out=self.flat_observation)
+            
+            if self.copy_obs:
+                return self.flat_observation.copy()
+            
+            return self.flat_observation_view
+        
+        if self.copy_obs:
+            return {key: value.copy() if isinstance(value, np.ndarray) else value
+                    for key, value in observation.items()}
+        
+        return observation
     
     
 
@@ -255,46 +552,78 @@ class AvalonEnv(gym.Env):
         truncated = self.truncated
         info = self.info
         
-        # action comes in as a (8,) for proposal
+        profiler = self.profiler
+        if profiler is not None:
+            token = profiler.start()
+        
+        # state the step was taken in, for the event trace
+        step_phase = self.phase
+        step_round = self.current_round
+        step_leader = self.leader
+        fail_votes = -1
+        outcome = event_trace.NO_OUTCOME
+        
+        # action comes in as a (8,) for proposal, or as a Discrete index
+        # into the team table of this round
         if self.phase == 'proposal':
             
             self.rendering_phase = 'proposal'
-        
-            mission_size = self.mission_sizes[self.current_round]
             
-            if np.sum(action) != mission_size:
-                raise ValueError('Invalid team size proposed.')
+            # every team in the table is legal, so only the index needs
+            # checking, as a negative one would wrap around to a valid team
+            if np.ndim(action) == 0:
+                teams = self.team_tables[self.current_round].teams
+                
+                if not 0 <= action < len(teams):
+                    raise ValueError('Invalid team index proposed.')
+                
+                self.proposed_team[:] = teams[action]
+                
+            else:
+                mission_size = self.mission_sizes[self.current_round]
+                
+                if np.sum(action) != mission_size:
+                    raise ValueError('Invalid team size proposed.')
+                
+                # store the proposed team
+                self.proposed_team[:] = action
             
-            # retrive the index of the proposed team
-            proposed_team = action
+            if self.game_log is not None:
+                self.game_log.propose(self.current_round, self.leader, self.proposed_team)
+                self._refresh_log_window()
+
+            # Move to the discussion if there is one, otherwise voting
+            self.phase = 'discussion' if self.discussion else 'voting'
             
+        # action comes in as (num_players, max_msg_len), every seat's message
+        elif self.phase == 'discussion':
             
-            self.proposed_team = proposed_team
-
-            # Move to voting phase
-            self.phase = 'voting'
+            self.rendering_phase = 'discussion'
             
-        
-            observation = {
-                        'phase': self.phase,
-                        'current_round': self.current_round,
-                        'leader': self.leader,
-                        'proposed_team': self.proposed_team.copy(),
-                        'votes': self.votes.copy(),
-                        'votes_history': self.votes_history.copy(),
-                        'mission_history': self.mission_history.copy(),
-                        'successful_missions': self.successful_missions,
-                        'failed_missions': self.failed_missions,
-                        'num_players': self.num_players,
-                        'mission_size': self.mission_sizes[self.current_round]
-                    } 
+            action = np.asarray(action)
+            
+            if action.shape != self.message_board.shape:
+                raise ValueError(f'Messages must have shape {self.message_board.shape}.')
+            
+            if action.min() < 0 or action.max() >= self.vocab_size:
+                raise ValueError('Message token outside of the vocabulary.')
+            
+            # post the messages, and write them into the oldest history slot
+            self.message_board[:] = action
+            self.message_history[self.message_count % self.message_history_len] = action
+            self.message_count += 1
+            
+            self.phase = 'voting'
         
         
         # action comes in as a (8,) for voting, all votes processed at once
         elif self.phase == 'voting':
             
             self.rendering_phase = 'voting'
-            self.votes = action
+            self.votes[:] = action
+            
+            if self.game_log is not None:
+                self.game_log.vote(self.votes)
             
             # 0 indicating a reject or 1 accept
             
@@ -302,205 +631,132 @@ class AvalonEnv(gym.Env):
             if np.sum(action) > self.num_players / 2:
                 # Team is approved
                 self.phase = 'mission'
-                
-                
-                observation = {
-                        'phase': self.phase,
-                        'current_round': self.current_round,
-                        'leader': self.leader,
-                        'proposed_team': self.proposed_team.copy(),
-                        'votes': self.votes.copy(),
-                        'votes_history': self.votes_history.copy(),
-                        'mission_history': self.mission_history.copy(),
-                        'successful_missions': self.successful_missions,
-                        'failed_missions': self.failed_missions,
-                        'num_players': self.num_players,
-                        'mission_size': self.mission_sizes[self.current_round]
-                    } 
-                
-                
+                outcome = event_trace.VOTE_PASSED
                 
             else:
                 # Team is rejected; leadership passes to next player
                 self.leader = (self.leader + 1) % self.num_players
                 self.phase = 'proposal'
-                
-                observation = {
-                        'phase': self.phase,
-                        'current_round': self.current_round,
-                        'leader': self.leader,
-                        'proposed_team': self.proposed_team.copy(),
-                        'votes': self.votes.copy(),
-                        'votes_history': self.votes_history.copy(),
-                        'mission_history': self.mission_history.copy(),
-                        'successful_missions': self.successful_missions,
-                        'failed_missions': self.failed_missions,
-                        'num_players': self.num_players,
-                        'mission_size': self.mission_sizes[self.current_round]
-                    } 
-                
+                outcome = event_trace.VOTE_REJECTED
                 
               
         elif self.phase == 'mission':
             
-             self.rendering_phase = 'mission'
-
-             self.current_mission_actions = action
-             
-             # count how many votes for mission failure
-             fail_votes = np.sum(action)
-             
-             # dealing with round that requires two fails
-             if self.current_round == self.two_fails_required_round:
-                 if fail_votes >= 2:
-                     self.failed_missions += 1
-                     mission_result = 'Fail'
-                 else:
-                     self.successful_missions += 1
-                     mission_result = 'Success'
-             
-                # otherwise proceed as normal round
+            self.rendering_phase = 'mission'
+
+            self.current_mission_actions = action
+            
+            # count how many votes for mission failure
+            fail_votes = np.sum(action)
+            
+            if self.game_log is not None:
+                self.game_log.mission(fail_votes)
+            
+            # dealing with round that requires two fails
+            if self.current_round == self.two_fails_required_round:
+                if fail_votes >= 2:
+                    self.failed_missions += 1
+                    mission_result = 'Fail'
+                    outcome = event_trace.MISSION_FAIL
                 else:
-                 if fail_votes >= 1:
-                     self.failed_missions += 1
-                     mission_result = 'Fail'
-                 else:
-                     self.successful_missions += 1
-                     mission_result = 'Success'
+                    self.successful_missions += 1
+                    mission_result = 'Success'
+                    outcome = event_trace.MISSION_SUCCESS
+            
+            # otherwise proceed as normal round
+            else:
+                if fail_votes >= 1:
+                    self.failed_missions += 1
+                    mission_result = 'Fail'
+                    outcome = event_trace.MISSION_FAIL
+                else:
+                    self.successful_missions += 1
+                    mission_result = 'Success'
+                    outcome = event_trace.MISSION_SUCCESS
+                   
+            # Update game state
+            self.current_round += 1
+            self.leader = (self.leader + 1) % self.num_players 
+            
+            
+            # as we have already updated the round, if it is drawed at 2, 2
+            # we must (un)update the round counter. This is not a great way to
+            # handle this but will do for now.
+            if self.successful_missions == 2 and self.failed_missions == 2:
+                self.current_round -= 1
+                
+            
+            # Check for game end conditions
+            if self.successful_missions >= 3:
+                # Proceed to assassination phase
+                self.phase = 'assassination'
+                    
+            elif self.failed_missions >= 3:
+                # Evil team wins
+                self.phase = 'game_over'
+                self.rewards = self.calculate_rewards(evil_win=True)
                     
-             # Update game state
-             self.current_round += 1
-             self.leader = (self.leader + 1) % self.num_players 
-             
-             
-             # as we have already updated the round, if it is drawed at 2, 2
-             # we must (un)update the round counter. This is not a great way to
-             # handle this but will do for now.
-             if self.successful_missions == 2 and self.failed_missions == 2:
-                 self.current_round -= 1
-                 
-             
-             # Check for game end conditions
-             if self.successful_missions >= 3 or self.failed_missions >= 3: 
-                 
-                 if self.successful_missions >= 3:
-                     # Proceed to assassination phase
-                     self.phase = 'assassination'
-                     
-                 else:
-                     # Evil team wins
-                     self.phase = 'game_over'
-                     self.rewards = self.calculate_rewards(evil_win=True)
-                     
-                 observation = {
-                       'phase': self.phase,
-                       'current_round': self.current_round,
-                       'leader': self.leader,
-                       'proposed_team': self.proposed_team.copy(),
-                       'votes': self.votes.copy(),
-                       'votes_history': self.votes_history.copy(),
-                       'mission_history': self.mission_history.copy(),
-                       'successful_missions': self.successful_missions,
-                       'failed_missions': self.failed_missions,
-                       'num_players': self.num_players,
-                       'mission_size': self.mission_sizes[self.current_round]
-                   }
-                     
-                     
-             else:
-                 # Proceed to next proposal phase
-                 self.phase = 'proposal'
-                 
-                 observation = {
-                        'phase': self.phase,
-                        'current_round': self.current_round,
-                        'leader': self.leader,
-                        'proposed_team': self.proposed_team.copy(),
-                        'votes': self.votes.copy(),
-                        'votes_history': self.votes_history.copy(),
-                        'mission_history': self.mission_history.copy(),
-                        'successful_missions': self.successful_missions,
-                        'failed_missions': self.failed_missions,
-                        'num_players': self.num_players,
-                        'mission_size': self.mission_sizes[self.current_round]
-                    }
-             
+            else:
+                # Proceed to next proposal phase
+                self.phase = 'proposal'
+            
         elif self.phase == 'assassination':
             
             self.rendering_phase = 'assassination'
             
             
-            if np.sum(action) == 0: # if there is no action proposed, then the state does not change
-                
-                # so do nothing
-                observation = {
-                        'phase': self.phase,
-                        'current_round': self.current_round,
-                        'leader': self.leader,
-                        'proposed_team': self.proposed_team.copy(),
-                        'votes': self.votes.copy(),
-                        'votes_history': self.votes_history.copy(),
-                        'mission_history': self.mission_history.copy(),
-                        'successful_missions': self.successful_missions,
-                        'failed_missions': self.failed_missions,
-                        'num_players': self.num_players,
-                        'mission_size': self.mission_sizes[self.current_round]
-                    } 
-                
-            
+            # if there is no action proposed, then the state does not change
             # otherwise, the assassin has made a guess, and now its needs processing
-            else:
-                # find where merlin is
-                merlin_idx = np.where(self.roles == 'Merlin')[0][0]
-                
-                if merlin_idx == np.where(action == 1)[0]:
+            if np.sum(action) != 0:
+                if self.merlin_idx == np.where(action == 1)[0]:
                     # Assassin guessed correctly
                     self.phase = 'game_over'
                     self.rewards = self.calculate_rewards(evil_win=True)
                     self.assassin_kill = True
+                    outcome = event_trace.MERLIN_ASSASSINATED
 
                 else:
                     # Assassin guessed incorrectly
                     self.phase = 'game_over'
                     
                     self.rewards = self.calculate_rewards(evil_win=False)
-                   
-                observation = {
-                        'phase': self.phase,
-                        'current_round': self.current_round,
-                        'leader': self.leader,
-                        'proposed_team': self.proposed_team.copy(),
-                        'votes': self.votes.copy(),
-                        'votes_history': self.votes_history.copy(),
-                        'mission_history': self.mission_history.copy(),
-                        'successful_missions': self.successful_missions,
-                        'failed_missions': self.failed_missions,
-                        'num_players': self.num_players,
-                        'mission_size': self.mission_sizes[self.current_round]
-                    } 
+                    outcome = event_trace.ASSASSINATION_MISSED
                 
         else:
             # game has ended
             self.dones = True
             self.rendering_phase = 'game_over'
             
+            if self.assassin_kill or self.failed_missions >= 3:
+                outcome = event_trace.EVIL_WIN
+            else:
+                outcome = event_trace.GOOD_WIN
             
-            observation = {
-                    'phase': self.phase,
-                    'current_round': self.current_round,
-                    'leader': self.leader,
-                    'proposed_team': self.proposed_team.copy(),
-                    'votes': self.votes.copy(),
-                    'votes_history': self.votes_history.copy(),
-                    'mission_history': self.mission_history.copy(),
-                    'successful_missions': self.successful_missions,
-                    'failed_missions': self.failed_missions,
-                    'num_players': self.num_players,
-                    'mission_size': self.mission_sizes[self.current_round]
-                } 
-            
+        if self.trace is not None:
+            self.trace.record(
+                self.phase_to_int(step_phase), step_round, step_leader,
+                event_trace.to_bitmask(self.proposed_team),
+                event_trace.to_bitmask(self.votes),
+                fail_votes, outcome
+            )
+        
+        if profiler is not None:
+            profiler.stop('env.' + step_phase, token)
+            token = profiler.start()
+        
         # print out what happened in that round.
-        self.render()
+        if self.render_mode == 'human':
+            self.render()
+            
+            if profiler is not None:
+                profiler.stop('env.render', token)
+                token = profiler.start()
+        
+        observation = self._get_observation()
+        
+        if profiler is not None:
+            profiler.stop('env.observation', token)
+            profiler.step_done()
         
         return observation, self.rewards, dones, truncated, info
                     
@@ -510,63 +766,80 @@ class AvalonEnv(gym.Env):
         """
         Calculate rewards for all players based on the game outcome.
         """
-        rewards = {}
-        for idx, role in enumerate(self.roles):
-            agent = 'player_' + str(idx)
-            if role in self.good_roles:
-                rewards[agent] = -1 if evil_win else 1
-            elif role in self.evil_roles:
-                rewards[agent] = 1 if evil_win else -1
-            else:
-                rewards[agent] = 0  # Neutral roles if any
+        profiler = self.profiler
+        if profiler is not None:
+            token = profiler.start()
+        
+        winning_team = self.evil_mask if evil_win else self.good_mask
+        
+        rewards = {agent: 1 if won else -1 for agent, won in zip(self.agent_names, winning_team)}
+        
+        if profiler is not None:
+            profiler.stop('env.rewards', token)
+        
         return rewards
 
-    def render(self, mode='human'):
+    def render(self):
         """
-        Render the environment's current state.
+        Render the environment's current state. Prints it in 'human' mode and
+        returns it as a string in 'ansi' mode.
         """
-        print(f"Phase: {self.rendering_phase}")
-        print(f"Round: {self.current_round}")
-        print(f"Leader: Player {self.leader}")
-        print(f"Successful Missions: {self.successful_missions}")
-        print(f"Failed Missions: {self.failed_missions}")
+        if self.render_mode is None:
+            return None
+        
+        lines = [
+            f"Phase: {self.rendering_phase}",
+            f"Round: {self.current_round}",
+            f"Leader: Player {self.leader}",
+            f"Successful Missions: {self.successful_missions}",
+            f"Failed Missions: {self.failed_missions}",
+        ]
         
         if self.rendering_phase == 'proposal':
-            print(f"Proposed Team: {getattr(self, 'proposed_team', 'Not proposed yet')}")
+            lines.append(f"Proposed Team: {getattr(self, 'proposed_team', 'Not proposed yet')}")
+            
+        elif self.rendering_phase == 'discussion':
+            lines.append('Messages:')
+            lines.extend(f'  Player {i}: {message}' for i, message in enumerate(self.message_board))
             
         elif self.rendering_phase == 'voting':
-            print(f"Votes: {self.votes} ")
+            lines.append(f"Votes: {self.votes} ")
             
             if np.sum(self.votes) > self.num_players / 2:
-                print('Vote passed!')
+                lines.append('Vote passed!')
                 
             else:
-                print('Vote rejectced!')
+                lines.append('Vote rejectced!')
                 
                 
         elif self.rendering_phase == 'mission':
-            print(f"Proposed Team: {getattr(self, 'proposed_team', 'Not proposed yet')}")
-            print(f"Mission Actions: {self.current_mission_actions}")
+            lines.append(f"Proposed Team: {getattr(self, 'proposed_team', 'Not proposed yet')}")
+            lines.append(f"Mission Actions: {self.current_mission_actions}")
             
             if np.sum(self.current_mission_actions) >= 1:
-                print('Mission Failed!')
+                lines.append('Mission Failed!')
             else:
-                print('Mission Succeeded!')
+                lines.append('Mission Succeeded!')
                 
         elif self.rendering_phase == 'game_over':
-            print(f'Rewards: {self.rewards}')
-            print(f'Roles: {self.roles}')
+            lines.append(f'Rewards: {self.rewards}')
+            lines.append(f'Roles: {parameters.decode_roles(self.roles)}')
             
             if self.assassin_kill == True:
-                print('Evil wins, assination of Merlin successful')
+                lines.append('Evil wins, assination of Merlin successful')
                 
             elif self.assassin_kill == False and self.successful_missions >= 3:
-                print('Good wins, assassin did not assassinate Merlin')
+                lines.append('Good wins, assassin did not assassinate Merlin')
                 
             elif self.failed_missions >= 3:
-                print('Evil wins by failing majority missions')
+                lines.append('Evil wins by failing majority missions')
             
-        print()
+        text = '\n'.join(lines) + '\n'
+        
+        if self.render_mode == 'ansi':
+            return text
+        
+        print(text)
 
     def close(self):
         """
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Bayesian beliefs over the hidden role assignment of an Avalon game.
+
+With 8 players there are 8! / 3! = 6720 distinct role assignments, as the
+three Loyal Servants are interchangeable. Every assignment is enumerated once
+and cached, and each player's belief is a probability vector over them. A
+player starts from the uniform distribution over the assignments consistent
+with their own role and secret knowledge, and after every vote and mission
+outcome each belief is multiplied by the likelihood of that outcome under
+every assignment. That is one (num_players, num_assignments) masked multiply
+per update, so beliefs for every perspective cost microseconds.
+
+Mission outcomes use the behaviour of agents.agent, good players always
+pass and evil players on the team fail with probability evil_fail_prob.
+Votes use vote_model[voter is evil, team has evil], the probability of
+accepting. The default of 0.5 everywhere matches the random agents, for which
+votes carry no information and are skipped.
+
+@author: sggjone5
+"""
+
+from functools import lru_cache
+from itertools import permutations
+from math import comb
+
+import numpy as np
+
+import parameters
+
+
+@lru_cache(maxsize=None)
+def role_assignments(roles):
+    """
+    Every distinct assignment of the roles tuple to the players, as a read
+    only (num_assignments, num_players) array of role codes.
+    """
+    assignments = np.array(sorted(set(permutations(roles))), dtype=np.int8)
+    assignments.flags.writeable = False
+
+    return assignments
+
+
+class BeliefTracker():
+    """
+    The belief of every player over the role assignments of one game.
+    """
+
+    def __init__(self, roles=parameters.roles_8_players, evil_fail_prob=0.5, vote_model=None):
+
+        self.assignments = role_assignments(tuple(int(role) for role in roles))
+        self.num_assignments, self.num_players = self.assignments.shape
+
+        # per assignment lookups, computed once
+        self.evil = parameters.is_evil[self.assignments].astype(np.float64)
+        self.merlin = (self.assignments == parameters.MERLIN).astype(np.float64)
+        self.one_hot = (self.assignments[:, :, None] == np.arange(parameters.num_role_codes)).reshape(
+            self.num_assignments, -1).astype(np.float64)
+
+        # fail_likelihood[k, f] is the chance of f fails with k evil on the team
+        p = evil_fail_prob
+        self.fail_likelihood = np.zeros((self.num_players + 1, self.num_players + 1))
+        for k in range(self.num_players + 1):
+            for f in range(k + 1):
+                self.fail_likelihood[k, f] = comb(k, f) * p ** f * (1 - p) ** (k - f)
+
+        self.vote_model = np.full((2, 2), 0.5) if vote_model is None else np.asarray(vote_model, dtype=np.float64)
+
+        # votes are only worth updating on if the model tells good from evil
+        self.informative_votes = not np.all(self.vote_model == self.vote_model[0, 0])
+
+        with np.errstate(divide='ignore'):
+            self.log_vote_model = np.log(self.vote_model)
+            self.log_vote_rejected = np.log(1 - self.vote_model)
+
+        self.beliefs = np.zeros((self.num_players, self.num_assignments))
+
+
+    def consistent(self, player_idx, role, secret_info):
+        """
+        Mask of the assignments consistent with a player's own role and
+        secret knowledge (role codes, -1 for unknown players).
+        """
+        secret_info = np.asarray(secret_info)
+
+        mask = self.assignments[:, player_idx] == role
+
+        known = np.flatnonzero(secret_info >= 0)
+        mask &= (self.assignments[:, known] == secret_info[known]).all(axis=1)
+
+        # a player would have known anyone with a role they can see
+        unknown = np.flatnonzero(secret_info < 0)
+        unknown = unknown[unknown != player_idx]
+        mask &= ~parameters.role_knowledge[role, self.assignments[:, unknown]].any(axis=1)
+
+        return mask
+
+
+    def reset(self, roles, secret_info):
+        """
+        Start every player's belief from their own role and secret knowledge,
+        with roles and secret_info as given by AvalonEnv.
+        """
+        for player_idx in range(self.num_players):
+            self.beliefs[player_idx] = self.consistent(player_idx, roles[player_idx], secret_info[player_idx])
+
+        self.beliefs /= self.beliefs.sum(axis=1, keepdims=True)
+
+
+    def _update(self, likelihood):
+        """
+        Multiply every belief by the likelihood of an outcome, and normalize.
+        """
+        totals = self.beliefs @ likelihood
+
+        # an outcome impossible under the model leaves the belief as it was
+        if not totals.all():
+            likelihood = np.where(totals[:, None] > 0, likelihood, 1)
+            totals[totals == 0] = 1
+
+        self.beliefs *= likelihood
+        self.beliefs /= totals[:, None]
+
+
+    def observe_mission(self, team, fails):
+        """
+        Update on the number of fails played on a mission by team.
+        """
+        evil_on_team = (self.evil @ np.asarray(team, dtype=np.float64)).astype(np.intp)
+
+        self._update(self.fail_likelihood[evil_on_team, int(fails)])
+
+
+    def observe_vote(self, team, votes):
+        """
+        Update on every player's vote for team, 1 accept.
+        """
+        if not self.informative_votes:
+            return
+
+        votes = np.asarray(votes, dtype=np.float64)
+
+        team_has_evil = (self.evil @ np.asarray(team, dtype=np.float64) > 0).astype(np.intp)
+
+        # the number of evil and good players accepting and rejecting
+        evil_accepts = self.evil @ votes
+        evil_rejects = self.evil.sum(axis=1) - evil_accepts
+        good_accepts = votes.sum() - evil_accepts
+        good_rejects = len(votes) - votes.sum() - evil_rejects
+
+        log_accept = self.log_vote_model[:, team_has_evil]
+        log_reject = self.log_vote_rejected[:, team_has_evil]
+
+        likelihood = np.exp(evil_accepts * log_accept[1] + evil_rejects * log_reject[1]
+                            + good_accepts * log_accept[0] + good_rejects * log_reject[0])
+
+        self._update(likelihood)
+
+
+    def observe_step(self, env):
+        """
+        Update on the outcome of the step just taken by env, if it was a
+        vote or a mission.
+        """
+        if env.rendering_phase == 'voting':
+            self.observe_vote(env.proposed_team, env.votes)
+
+        elif env.rendering_phase == 'mission':
+            self.observe_mission(env.proposed_team, np.sum(env.current_mission_actions))
+
+
+    def role_marginals(self):
+        """
+        (num_players, num_players, num_role_codes) where [i, j, r] is player
+        i's belief that player j has role r.
+        """
+        return (self.beliefs @ self.one_hot).reshape(self.num_players, self.num_players, -1)
+
+
+    def evil_marginals(self):
+        """
+        (num_players, num_players) where [i, j] is player i's belief that
+        player j is evil.
+        """
+        return self.beliefs @ self.evil
+
+
+    def merlin_marginals(self):
+        """
+        (num_players, num_players) where [i, j] is player i's belief that
+        player j is Merlin.
+        """
+        return self.beliefs @ self.merlin
+
+
+    def assassination_target(self, assassin_idx):
+        """
+        The player the assassin believes is most likely to be Merlin.
+        """
+        return int(np.argmax(self.merlin_marginals()[assassin_idx]))
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the Avalon environment.
+
+Measures:
+
+    - steps per second of AvalonEnv.step in each phase
+    - the cost of AvalonEnv.reset, and of assign_roles on its own
+    - full games per second between the random agents, as played by main.py
+    - closed form games per second from rollout.rollout_games
+    - the cost of building the observation in each observation mode
+    - memory allocated per step
+    - a clone_state / restore_state snapshot cycle
+
+Results can be saved as a baseline JSON file, and later runs are compared
+against it, reporting any benchmark which has got worse by more than the
+tolerance. For example
+
+    python benchmark.py --save          # store a new baseline
+    python benchmark.py                 # compare against the baseline
+
+@author: sggjone5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from avalon_env import AvalonEnv
+import rollout
+import main
+
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def time_per_call(func, number, repeat=5):
+    """
+    Best time per call of func over repeat runs of number calls each.
+    """
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+
+    return best
+
+
+def bench_step_phases(number):
+    """
+    Steps per second in each phase. The env is put back into the phase
+    before every step, so each step runs the same branch.
+    """
+    env = AvalonEnv()
+    env.reset()
+
+    team = np.zeros(env.num_players, dtype=np.int8)
+    team[:env.mission_sizes[0]] = 1
+
+    reject = np.zeros(env.num_players, dtype=np.int8)
+    succeed = np.zeros(env.num_players, dtype=np.int8)
+
+    # assassinate a player who is not Merlin, so the guess misses
+    miss = np.zeros(env.num_players, dtype=np.int8)
+    miss[(env.merlin_idx + 1) % env.num_players] = 1
+
+    def proposal():
+        env.phase = 'proposal'
+        env.step(team)
+
+    def voting():
+        env.phase = 'voting'
+        env.step(reject)
+
+    def mission():
+        env.phase = 'mission'
+        env.current_round = 0
+        env.successful_missions = 0
+        env.failed_missions = 0
+        env.step(succeed)
+
+    def assassination():
+        env.phase = 'assassination'
+        env.step(miss)
+
+    results = {}
+    for name, func in [('proposal', proposal), ('voting', voting),
+                       ('mission', mission), ('assassination', assassination)]:
+        results['step_' + name] = (1 / time_per_call(func, number), 'steps/s', True)
+
+    return results
+
+
+def bench_reset(number):
+    """
+    Cost of a full reset, and of assigning the roles on their own.
+    """
+    env = AvalonEnv()
+
+    return {
+        'reset': (time_per_call(env.reset, number) * 1e6, 'us', False),
+        'assign_roles': (time_per_call(env.assign_roles, number) * 1e6, 'us', False),
+    }
+
+
+def bench_games(number):
+    """
+    Full games per second between the random agents.
+    """
+    env = AvalonEnv()
+
+    return {'games': (1 / time_per_call(lambda: main.play_game(env), number, repeat=3), 'games/s', True)}
+
+
+def bench_rollout(number):
+    """
+    Closed form games per second, a million games per call.
+    """
+    rng = np.random.default_rng(0)
+
+    return {'rollout_games': (1e6 / time_per_call(lambda: rollout.rollout_games(1000000, rng=rng), number, repeat=3),
+                              'games/s', True)}
+
+
+def bench_observation(number):
+    """
+    Cost of building the observation, in each observation mode.
+    """
+    results = {}
+
+    for name, kwargs in [('dict_copy', {}),
+                         ('dict_view', {'copy_obs': False}),
+                         ('flat_copy', {'obs_mode': 'flat'}),
+                         ('flat_view', {'obs_mode': 'flat', 'copy_obs': False})]:
+
+        env = AvalonEnv(**kwargs)
+        env.reset()
+
+        results['observation_' + name] = (time_per_call(env._get_observation, number) * 1e6, 'us', False)
+
+    return results
+
+
+def bench_memory(number):
+    """
+    Peak memory allocated per step while playing full games, in bytes.
+    """
+    env = AvalonEnv()
+    main.play_game(env)
+
+    env.reset()
+    player_models = [main.agent(i, env.roles[i], env.observation, env.secret_info[i]) for i in env.agents]
+
+    total = 0
+    steps = 0
+
+    tracemalloc.start()
+
+    while steps < number:
+
+        if env.dones:
+            env.reset()
+
+        action = main.select_action(env, player_models, env.observation)
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+
+        env.step(action)
+
+        total += tracemalloc.get_traced_memory()[1] - before
+        steps += 1
+
+    tracemalloc.stop()
+
+    return {'memory_per_step': (total / steps, 'bytes', False)}
+
+
+def bench_snapshot(number):
+    """
+    Cost of one clone_state and restore_state cycle into a reused snapshot.
+    """
+    env = AvalonEnv()
+    env.reset(seed=0)
+    snapshot = env.clone_state()
+
+    def cycle():
+        env.clone_state(snapshot)
+        env.restore_state(snapshot)
+
+    return {'snapshot_cycle': (time_per_call(cycle, number) * 1e6, 'us', False)}
+
+
+def run_benchmarks(quick=False):
+    """
+    Run every benchmark, returning {name: {'value', 'unit', 'higher_is_better'}}.
+    """
+    scale = 10 if quick else 1
+
+    results = {}
+    results.update(bench_step_phases(20000 // scale))
+    results.update(bench_reset(5000 // scale))
+    results.update(bench_games(200 // scale))
+    results.update(bench_rollout(max(5 // scale, 1)))
+    results.update(bench_observation(20000 // scale))
+    results.update(bench_memory(5000 // scale))
+    results.update(bench_snapshot(20000 // scale))
+
+    return {name: {'value': value, 'unit': unit, 'higher_is_better': higher}
+            for name, (value, unit, higher) in results.items()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against a baseline, returning the names of the
+    benchmarks that are worse by more than the tolerance fraction.
+    """
+    regressions = []
+
+    for name, result in results.items():
+
+        if name not in baseline:
+            continue
+
+        old = baseline[name]['value']
+        new = result['value']
+
+        if old == 0:
+            continue
+
+        # positive change is always an improvement
+        change = (new - old) / old
+        if not result['higher_is_better']:
+            change = -change
+
+        if change < -tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the Avalon environment.')
+    parser.add_argument('--baseline', default=default_baseline, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='fraction a benchmark can get worse by')
+    parser.add_argument('--quick', action='store_true', help='run fewer iterations')
+    args = parser.parse_args()
+
+    results = run_benchmarks(quick=args.quick)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for name, result in results.items():
+        line = f"{name:<24} {result['value']:>14.2f} {result['unit']}"
+
+        if name in baseline:
+            old = baseline[name]['value']
+            line += f"   (baseline {old:.2f}, {100 * (result['value'] - old) / old:+.1f}%)"
+
+        print(line)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+
+    elif baseline:
+        regressions = compare(results, baseline, args.tolerance)
+
+        if regressions:
+            print(f"Regressions beyond {100 * args.tolerance:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+        print('No regressions')
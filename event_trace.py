@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+An in-memory event trace for the Avalon environment.
+
+Every step of the environment can be stored as one fixed width record in a
+preallocated ring buffer, so full game logs can be kept without printing on
+every step. Once the buffer is full the oldest records are overwritten. The
+records can be written out in bulk with dump, and read back with load.
+
+Each record holds:
+
+    game      - index of the game the step belongs to
+    phase     - phase integer the step was taken in (see AvalonEnv.phase_to_int)
+    round     - round the step was taken in
+    leader    - leader when the step was taken
+    team      - proposed team as a bitmask, player i at bit i
+    votes     - votes as a bitmask, player i at bit i
+    fails     - number of fail votes on a mission, -1 outside of missions
+    outcome   - one of the outcome codes below
+
+@author: sggjone5
+"""
+
+import numpy as np
+
+
+# outcome codes for each record
+NO_OUTCOME = 0
+VOTE_PASSED = 1
+VOTE_REJECTED = 2
+MISSION_SUCCESS = 3
+MISSION_FAIL = 4
+MERLIN_ASSASSINATED = 5
+ASSASSINATION_MISSED = 6
+GOOD_WIN = 7
+EVIL_WIN = 8
+
+outcome_names = [
+    'none',
+    'vote passed',
+    'vote rejected',
+    'mission success',
+    'mission fail',
+    'merlin assassinated',
+    'assassination missed',
+    'good win',
+    'evil win',
+]
+
+event_dtype = np.dtype([
+    ('game', np.uint32),
+    ('phase', np.int8),
+    ('round', np.int8),
+    ('leader', np.int8),
+    ('team', np.uint16),
+    ('votes', np.uint16),
+    ('fails', np.int8),
+    ('outcome', np.int8),
+])
+
+# bit weights used to turn binary player vectors into bitmasks
+bit_weights = 1 << np.arange(16, dtype=np.int64)
+
+
+def to_bitmask(players):
+    """
+    Turn a binary vector over the players into an integer bitmask.
+    """
+    players = np.asarray(players)
+    return int(players @ bit_weights[:len(players)])
+
+
+def from_bitmask(mask, num_players):
+    """
+    Turn an integer bitmask back into a binary vector over the players.
+    """
+    return ((int(mask) >> np.arange(num_players)) & 1).astype(np.int8)
+
+
+class EventTrace():
+    """
+    Preallocated ring buffer of fixed width step records.
+    """
+
+    def __init__(self, capacity=65536):
+
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=event_dtype)
+
+        self.count = 0 # total records written, including overwritten ones
+        self.game = 0
+
+
+    def new_game(self):
+        """
+        Start a new game, called by the environment on reset.
+        """
+        if self.count > 0:
+            self.game += 1
+
+
+    def record(self, phase, current_round, leader, team, votes, fails, outcome):
+        """
+        Store a single step, team and votes are given as bitmasks.
+        """
+        self.records[self.count % self.capacity] = (
+            self.game, phase, current_round, leader, team, votes, fails, outcome
+        )
+        self.count += 1
+
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+    def events(self):
+        """
+        Returns the stored records in the order they were written.
+        """
+        if self.count <= self.capacity:
+            return self.records[:self.count]
+
+        start = self.count % self.capacity
+        return np.concatenate((self.records[start:], self.records[:start]))
+
+
+    def clear(self):
+        """
+        Forget all stored records.
+        """
+        self.count = 0
+        self.game = 0
+
+
+    def dump(self, path):
+        """
+        Write all stored records to a .npy file in one go.
+        """
+        np.save(path, self.events())
+
+
+    @staticmethod
+    def load(path):
+        """
+        Read records previously written with dump.
+        """
+        return np.load(path)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+An append-only log of every proposal of one game of Avalon.
+
+votes_history and mission_history in the observation hold one row per
+round, so any proposal that was rejected is lost once proposed_team is
+overwritten. The game log keeps every proposal in the order it was made,
+one row each:
+
+    round     - round the proposal was made in
+    leader    - the player who proposed it
+    team      - the proposed team, 1 on the team
+    votes     - every player's vote, 1 accept, all 0 until it is voted on
+    fails     - fail votes of its mission, -1 if it was rejected or the
+                mission has not been played yet
+
+The columns are preallocated for capacity proposals, 25 by default, five
+proposals in each of five rounds. There is no five rejection rule in this
+env, so a long game can make more, and the columns are then reallocated at
+double the size, keeping every append amortized O(1). Clearing for a new game
+only resets the rows used, so it costs no more than the game did.
+
+rows returns read only views of the rows logged, and window read only views
+of a fixed number of rows, the latest ones once there are more, which is
+what AvalonEnv puts in its observation. Rows past the length are always
+empty. The columns are replaced when the log grows, so views should be
+fetched again after each proposal rather than kept.
+
+@author: sggjone5
+"""
+
+import numpy as np
+
+
+default_capacity = 25 # five proposals in each of five rounds
+
+
+class GameLog():
+    """
+    Every proposal of one game, with its votes and mission result.
+    """
+
+    columns = ('round', 'leader', 'team', 'votes', 'fails')
+
+    def __init__(self, num_players=8, capacity=default_capacity):
+
+        self.num_players = num_players
+        self.length = 0
+
+        self._allocate(max(capacity, 1))
+
+
+    def _allocate(self, capacity):
+        """
+        Allocate the columns for capacity proposals, keeping the rows logged
+        so far.
+        """
+        old = getattr(self, 'arrays', None)
+
+        self.capacity = capacity
+        self.arrays = {
+            'round': np.zeros(capacity, dtype=np.int8),
+            'leader': np.zeros(capacity, dtype=np.int8),
+            'team': np.zeros((capacity, self.num_players), dtype=np.int8),
+            'votes': np.zeros((capacity, self.num_players), dtype=np.int8),
+            'fails': np.full(capacity, -1, dtype=np.int8),
+        }
+
+        if old is not None:
+            for name in self.columns:
+                self.arrays[name][:self.length] = old[name][:self.length]
+
+        # the columns are also kept as attributes, to avoid dict lookups
+        self.round = self.arrays['round']
+        self.leader = self.arrays['leader']
+        self.team = self.arrays['team']
+        self.votes = self.arrays['votes']
+        self.fails = self.arrays['fails']
+
+        self.views = {name: self._read_only(array) for name, array in self.arrays.items()}
+
+
+    @staticmethod
+    def _read_only(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+
+    def __len__(self):
+        return self.length
+
+
+    def _empty_rows(self, start, stop):
+        """
+        Return rows start to stop to their empty values.
+        """
+        for name in self.columns:
+            self.arrays[name][start:stop] = -1 if name == 'fails' else 0
+
+
+    def propose(self, current_round, leader, team):
+        """
+        Append a proposal.
+        """
+        if self.length == self.capacity:
+            self._allocate(2 * self.capacity)
+
+        row = self.length
+        self.round[row] = current_round
+        self.leader[row] = leader
+        self.team[row] = team
+        self.votes[row] = 0
+        self.fails[row] = -1
+
+        self.length = row + 1
+
+
+    def vote(self, votes):
+        """
+        Record the votes on the latest proposal.
+        """
+        self.votes[self.length - 1] = votes
+
+
+    def mission(self, fails):
+        """
+        Record the fail votes of the latest proposal's mission.
+        """
+        self.fails[self.length - 1] = fails
+
+
+    def clear(self):
+        """
+        Empty the log for a new game, only resetting the rows used.
+        """
+        self._empty_rows(0, self.length)
+        self.length = 0
+
+
+    def copy_from(self, other):
+        """
+        Make this log a copy of other, copying only the rows logged.
+        """
+        if other.length > self.capacity:
+            self.length = 0
+            self._allocate(max(other.capacity, 2 * self.capacity))
+
+        length = other.length
+        for name in self.columns:
+            self.arrays[name][:length] = other.arrays[name][:length]
+
+        self._empty_rows(length, self.length)
+        self.length = length
+
+
+    def to_bytes(self):
+        """
+        The logged rows as bytes, column after column.
+        """
+        length = self.length
+        return b''.join(self.arrays[name][:length].tobytes() for name in self.columns)
+
+
+    def load_bytes(self, data):
+        """
+        Replace the log with rows packed by to_bytes.
+        """
+        # every column is int8, one byte per player in team and votes
+        length = len(data) // (2 * self.num_players + 3)
+
+        if length > self.capacity:
+            self.length = 0
+            self._allocate(max(length, 2 * self.capacity))
+
+        offset = 0
+        for name in self.columns:
+            column = self.arrays[name][:length]
+            column.reshape(-1)[:] = np.frombuffer(data, np.int8, column.size, offset)
+            offset += column.size
+
+        self._empty_rows(length, self.length)
+        self.length = length
+
+
+    def passed(self):
+        """
+        Whether each logged proposal was voted through, False for any not
+        voted on yet.
+        """
+        return 2 * self.votes[:self.length].sum(axis=1) > self.num_players
+
+
+    def rows(self):
+        """
+        A dict of the logged rows of every column, as read only views.
+        """
+        return {name: view[:self.length] for name, view in self.views.items()}
+
+
+    def window(self, size=default_capacity):
+        """
+        A dict of read only views of size rows of every column, the first
+        size while fewer proposals have been logged and the latest size
+        after, so min(length, size) of them are logged rows.
+        """
+        if self.capacity < size:
+            self._allocate(size)
+
+        start = max(self.length - size, 0)
+        return {name: view[start:start + size] for name, view in self.views.items()}
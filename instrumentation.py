@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the Avalon environment and the agents playing it.
+
+A StepProfiler passed to AvalonEnv(profiler=...) times every step, split
+into sections:
+
+    env.proposal, env.voting,   - the phase branch of AvalonEnv.step,
+    env.mission, ...              including the event trace and rewards
+    env.rewards                 - calculate_rewards, also inside its phase
+    env.render                  - render, in 'human' mode
+    env.observation             - building the returned observation
+
+and main.play_game adds policy.<phase> sections for the agents' decisions,
+so the cost of the env and the cost of the policy can be told apart.
+
+Every section keeps its call count, total time and a histogram of
+latencies in power of two nanosecond buckets. With track_allocations=True
+it also keeps the net number of memory blocks allocated, from
+sys.getallocatedblocks, which only grows if a section keeps what it
+allocates. That walks every memory arena on each call, tens of
+microseconds once NumPy is loaded, so it is off by default and the
+latencies it is on for are mostly its own. When no profiler is given every
+hook is a single 'is not None' check, so the cost when disabled is close to
+nothing.
+
+stats() returns everything as a dict, and summary() as a table. With
+dump_every set, the summary is written to dump_file every dump_every steps.
+
+@author: sggjone5
+"""
+
+import sys
+import time
+
+
+num_buckets = 48 # latencies up to 2 ** 47 ns, about 39 hours
+
+
+class _section():
+    """
+    The running totals of one profiled section.
+    """
+
+    __slots__ = ('count', 'total_ns', 'blocks', 'histogram')
+
+    def __init__(self):
+
+        self.count = 0
+        self.total_ns = 0
+        self.blocks = 0
+        self.histogram = [0] * num_buckets
+
+
+class StepProfiler():
+    """
+    Per section call counts, latencies and allocations.
+
+        token = profiler.start()
+        ...
+        profiler.stop('section name', token)
+    """
+
+    def __init__(self, dump_every=None, dump_file=None, track_allocations=False):
+
+        self.dump_every = dump_every # steps between summaries, None for never
+        self.dump_file = dump_file if dump_file is not None else sys.stdout
+        self.track_allocations = track_allocations
+
+        self.sections = {}
+        self.steps = 0
+
+
+    def start(self):
+        """
+        The token to pass to stop at the end of the section.
+        """
+        if self.track_allocations:
+            return time.perf_counter_ns(), sys.getallocatedblocks()
+
+        return time.perf_counter_ns(), 0
+
+
+    def stop(self, name, token):
+        """
+        Record one call of a section started with start.
+        """
+        elapsed = time.perf_counter_ns() - token[0]
+        blocks = sys.getallocatedblocks() - token[1] if self.track_allocations else 0
+
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = _section()
+
+        section.count += 1
+        section.total_ns += elapsed
+        section.blocks += blocks
+        section.histogram[min(elapsed.bit_length(), num_buckets - 1)] += 1
+
+
+    def step_done(self):
+        """
+        Count a finished env step, dumping the summary when it is due.
+        """
+        self.steps += 1
+
+        if self.dump_every is not None and self.steps % self.dump_every == 0:
+            print(self.summary(), file=self.dump_file)
+
+
+    @staticmethod
+    def _percentile(histogram, count, fraction):
+        """
+        The upper edge of the bucket holding the fraction of calls, in ns.
+        """
+        target = fraction * count
+        seen = 0
+
+        for bucket, calls in enumerate(histogram):
+            seen += calls
+            if seen >= target:
+                return 2 ** bucket
+
+        return 2 ** (num_buckets - 1)
+
+
+    def stats(self):
+        """
+        Every section's count, total and mean time, approximate p50 and p99
+        latencies from the histogram, net allocated blocks per call and the
+        histogram itself, where bucket b counts calls under 2 ** b ns.
+        """
+        stats = {}
+
+        for name, section in sorted(self.sections.items()):
+            count = section.count
+
+            stats[name] = {
+                'count': count,
+                'total_s': section.total_ns / 1e9,
+                'mean_us': section.total_ns / count / 1e3,
+                'p50_us': self._percentile(section.histogram, count, 0.5) / 1e3,
+                'p99_us': self._percentile(section.histogram, count, 0.99) / 1e3,
+                'blocks_per_call': section.blocks / count,
+                'histogram': list(section.histogram),
+            }
+
+        return stats
+
+
+    def summary(self):
+        """
+        The stats as a table, with each section's share of the total time.
+        """
+        stats = self.stats()
+
+        # nested sections (env.rewards) are counted in their phase too
+        total = sum(s['total_s'] for name, s in stats.items() if name != 'env.rewards') or 1
+
+        lines = [f"{'section':<22}{'calls':>10}{'total s':>10}{'share':>8}{'mean us':>10}"
+                 f"{'p50 us':>10}{'p99 us':>10}{'blocks':>9}"]
+
+        for name, s in stats.items():
+            lines.append(f"{name:<22}{s['count']:>10}{s['total_s']:>10.3f}{100 * s['total_s'] / total:>7.1f}%"
+                         f"{s['mean_us']:>10.2f}{s['p50_us']:>10.2f}{s['p99_us']:>10.2f}{s['blocks_per_call']:>9.2f}")
+
+        return '\n'.join(lines)
+
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        self.sections = {}
+        self.steps = 0
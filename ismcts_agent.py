@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+An information set Monte Carlo tree search (ISMCTS) agent for Avalon.
+
+The agent cannot see the other players' roles, so every simulation starts
+by sampling a role assignment (a determinization) consistent with what it
+does know: its own role, and the roles given by its secret knowledge. The
+game is then played forward through AvalonEnv.step. At the points where the
+agent itself has a decision, actions are chosen by UCB from the search
+statistics. The rest of the seats, and the agent after leaving the tree,
+play the random agent behaviour.
+
+Search statistics are kept in a transposition table keyed on the public game
+state (packed_state.PackedState.public_key) along with the agent's seat and
+private knowledge. Determinizations that reach the same public state share a
+node, as in ISMCTS. A table can be shared between several agents.
+
+Each decision runs until the iteration budget or the time budget runs out,
+whichever comes first, but always runs at least one simulation. With
+workers > 1 the search is root parallelized: each worker searches
+independently until the same deadline and the root visit counts are summed.
+The worker pool is started on the first decision and kept until close.
+Process workers are sent a copy of the agent once, when they start, and each
+keeps its own table from one decision to the next, while thread workers
+share the agent's table.
+
+@author: sggjone5
+"""
+
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import parameters
+from agents import agent
+from avalon_env import AvalonEnv
+from packed_state import PackedState
+
+
+class _node():
+    """
+    Search statistics for the agent's actions at one information set.
+    """
+
+    __slots__ = ('visits', 'action_visits', 'action_values')
+
+    def __init__(self):
+
+        self.visits = 0
+        self.action_visits = {}
+        self.action_values = {}
+
+
+class ismcts_agent(agent):
+    """
+    An agent which chooses each action with ISMCTS, using the same
+    select_action_* interface as agents.agent.
+    """
+
+    def __init__(self, agent_idx, role, observation, secret_role_knowledge, rng=None,
+                 iterations=200, time_budget=None, exploration=0.7, num_determinizations=32,
+                 workers=1, parallel='process', table=None, max_table_size=1000000):
+
+        super().__init__(agent_idx, role, observation, secret_role_knowledge, rng)
+
+        self.iterations = iterations # simulations per decision
+        self.time_budget = time_budget # seconds per decision, None for no limit
+        self.exploration = exploration # UCB exploration constant
+        self.num_determinizations = num_determinizations # role assignments sampled per decision
+        self.workers = workers
+        self.parallel = parallel # 'process' or 'thread'
+        self.max_table_size = max_table_size
+
+        self.table = table if table is not None else {}
+
+        self._executor = None # the worker pool, started by the first parallel decision
+        self._searchers = None # a copy of the agent per thread worker
+
+        # the agent's private information, added to every table key
+        self.private_key = (agent_idx, int(role), np.asarray(secret_role_knowledge, dtype=np.int8).tobytes())
+
+        self.env = AvalonEnv(num_players=observation['num_players'], copy_obs=False)
+
+
+    def sample_roles(self, num_samples):
+        """
+        Sample role assignments consistent with the agent's own role and
+        secret knowledge, as (num_samples, num_players) role codes.
+        """
+        known = np.asarray(self.secret_role_knowledge, dtype=np.int8).copy()
+        known[self.agent_idx] = self.role
+
+        # the roles not yet accounted for are shuffled over the unknown seats
+        remaining = list(self.env.rules.roles)
+        for code in known[known >= 0]:
+            remaining.remove(code)
+
+        unknown = np.flatnonzero(known < 0)
+
+        roles = np.tile(known, (num_samples, 1))
+        roles[:, unknown] = parameters.draw_roles(self.rng, num_samples, np.array(remaining, dtype=np.int8))
+
+        return roles
+
+
+    def _load_observation(self, observation):
+        """
+        Put the search env into the public state given by an observation.
+        """
+        env = self.env
+
+        env.phase = AvalonEnv.phase_names[observation['phase']]
+        env.rendering_phase = env.phase
+        env.current_round = int(observation['current_round'])
+        env.leader = int(observation['leader'])
+        env.successful_missions = int(observation['successful_missions'])
+        env.failed_missions = int(observation['failed_missions'])
+        env.assassin_kill = False
+        env.dones = False
+        env.rewards = {}
+
+        env.proposed_team[:] = observation['proposed_team']
+        env.votes[:] = observation['votes']
+        env.votes_history[:] = observation['votes_history']
+        env.mission_history[:] = observation['mission_history']
+
+
+    def _my_actions(self):
+        """
+        The agent's legal actions in the search env's current state, or None
+        if the agent has no decision to make.
+        """
+        env = self.env
+
+        if env.phase == 'proposal':
+            if env.leader == self.agent_idx:
+                return range(len(env.team_tables[env.current_round]))
+
+        elif env.phase == 'voting':
+            return (0, 1)
+
+        elif env.phase == 'mission':
+            # good players always pass, so only evil team members decide
+            if env.proposed_team[self.agent_idx] and env.evil_mask[self.agent_idx]:
+                return (0, 1)
+
+        elif env.phase == 'assassination':
+            if env.assassin_idx == self.agent_idx:
+                return np.flatnonzero(env.assassination_mask)
+
+        return None
+
+
+    def _random_action(self):
+        """
+        The collated action of every seat playing the random agent behaviour.
+        """
+        env = self.env
+        num_players = env.num_players
+
+        if env.phase == 'proposal':
+            table = env.team_tables[env.current_round]
+            return table.teams[self.rng.integers(len(table))]
+
+        elif env.phase == 'voting':
+            return (self.rng.random(num_players) < 0.5).astype(np.int8)
+
+        elif env.phase == 'mission':
+            fails = (self.rng.random(num_players) < 0.5) & env.evil_mask
+            return (fails & (env.proposed_team == 1)).astype(np.int8)
+
+        action = np.zeros(num_players, dtype=np.int8)
+        action[self.rng.integers(num_players)] = 1
+        return action
+
+
+    def _apply(self, action, my_action):
+        """
+        Step the search env with the random action of every seat, with the
+        agent's own part replaced by my_action.
+        """
+        env = self.env
+
+        if env.phase == 'proposal':
+            env.step(my_action)
+
+        elif env.phase == 'assassination':
+            target = np.zeros(env.num_players, dtype=np.int8)
+            target[my_action] = 1
+            env.step(target)
+
+        else:
+            action[self.agent_idx] = my_action
+            env.step(action)
+
+
+    def _select(self, node, actions):
+        """
+        Choose an action at a node by UCB, trying unvisited actions first.
+        """
+        best = None
+        best_score = -math.inf
+        log_visits = math.log(max(node.visits, 1))
+
+        for action in actions:
+            action = int(action)
+            visits = node.action_visits.get(action, 0)
+
+            if visits == 0:
+                return action
+
+            score = (node.action_values[action] / visits
+                     + self.exploration * math.sqrt(log_visits / visits))
+
+            if score > best_score:
+                best = action
+                best_score = score
+
+        return best
+
+
+    def search(self, observation, deadline=None):
+        """
+        Run ISMCTS from the public state in observation, returning the visit
+        counts of the agent's actions at the root. deadline is a
+        time.perf_counter time to stop by, which defaults to time_budget
+        from now.
+        """
+        env = self.env
+        self._load_observation(observation)
+
+        # one snapshot per sampled role assignment, so each simulation only
+        # has to restore one rather than rebuild the role lookups
+        snapshots = []
+        for roles in self.sample_roles(self.num_determinizations):
+            env.set_roles(roles)
+            snapshots.append(env.clone_state())
+
+        if len(self.table) > self.max_table_size:
+            self.table.clear()
+
+        if deadline is None and self.time_budget is not None:
+            deadline = time.perf_counter() + self.time_budget
+
+        reward_key = env.agent_names[self.agent_idx]
+
+        root_key = None
+
+        # the first simulation always runs, so there is a root to choose from
+        for iteration in range(max(self.iterations, 1)):
+
+            if iteration and deadline is not None and time.perf_counter() > deadline:
+                break
+
+            env.restore_state(snapshots[self.rng.integers(len(snapshots))])
+
+            path = []
+            in_tree = True
+
+            while env.phase != 'game_over':
+
+                action = self._random_action()
+                actions = self._my_actions()
+
+                if actions is None:
+                    env.step(action)
+                    continue
+
+                if in_tree:
+                    key = (PackedState.from_env(env).public_key(), self.private_key)
+                    node = self.table.get(key)
+
+                    # expand one new node per simulation, then roll out
+                    if node is None:
+                        node = self.table[key] = _node()
+                        in_tree = False
+
+                    if root_key is None:
+                        root_key = key
+
+                    my_action = self._select(node, actions)
+                    path.append((node, my_action))
+
+                else:
+                    my_action = int(actions[self.rng.integers(len(actions))])
+
+                self._apply(action, my_action)
+
+            reward = env.rewards[reward_key]
+
+            for node, my_action in path:
+                node.visits += 1
+                node.action_visits[my_action] = node.action_visits.get(my_action, 0) + 1
+                node.action_values[my_action] = node.action_values.get(my_action, 0) + reward
+
+        return dict(self.table[root_key].action_visits) if root_key is not None else {}
+
+
+    def decide(self, observation):
+        """
+        Search, in parallel if there are several workers, and return the
+        agent's most visited root action.
+        """
+        if self.workers == 1:
+            visits = self.search(observation)
+
+        else:
+            # the deadline is fixed before dispatching, so the time spent
+            # handing out the work counts against the budget
+            deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+            seeds = self.rng.integers(0, 2 ** 63, self.workers)
+
+            executor = self._get_executor()
+
+            if self.parallel == 'process':
+                results = executor.map(_process_search, [observation] * self.workers, seeds,
+                                        [deadline] * self.workers)
+            else:
+                results = executor.map(_thread_search, self._searchers, [observation] * self.workers, seeds,
+                                       [deadline] * self.workers)
+
+            visits = {}
+            for result in results:
+                for action, count in result.items():
+                    visits[action] = visits.get(action, 0) + count
+
+        # with no simulation finished there is nothing to choose from
+        if not visits:
+            self._load_observation(observation)
+            actions = self._my_actions()
+            return int(actions[self.rng.integers(len(actions))])
+
+        return max(visits, key=visits.get)
+
+
+    def _get_executor(self):
+        """
+        The worker pool, started on the first call.
+        """
+        if self._executor is None:
+
+            if self.parallel == 'process':
+                self._executor = ProcessPoolExecutor(self.workers, initializer=_init_process_search,
+                                                     initargs=(self,))
+            else:
+                self._searchers = [_copy_searcher(self) for _ in range(self.workers)]
+                self._executor = ThreadPoolExecutor(self.workers)
+
+        return self._executor
+
+
+    def close(self):
+        """
+        Shut down the worker pool, if one was started.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            self._searchers = None
+
+
+    def select_action_proposal(self, observation):
+
+        team_idx = self.decide(observation)
+
+        return list(self.env.team_tables[observation['current_round']].teams[team_idx])
+
+
+    def select_action_voting(self, observation):
+
+        return self.decide(observation)
+
+
+    def select_action_mission(self, observation):
+
+        # good players always pass
+        if not parameters.is_evil[self.role]:
+            return 0
+
+        return self.decide(observation)
+
+
+    def select_action_assassination(self, observation):
+
+        action = [0] * observation['num_players']
+        action[self.decide(observation)] = 1
+
+        return action
+
+
+    def __getstate__(self):
+        # process workers start from an empty table, without the pool
+        state = self.__dict__.copy()
+        state['table'] = {}
+        state['_executor'] = None
+        state['_searchers'] = None
+        return state
+
+
+    def __del__(self):
+        if getattr(self, '_executor', None) is not None:
+            self.close()
+
+
+def _copy_searcher(searcher):
+    """
+    A copy of the agent which searches by itself, sharing the table but not
+    the search env.
+    """
+    worker = ismcts_agent.__new__(ismcts_agent)
+    worker.__dict__.update(searcher.__dict__)
+    worker.env = AvalonEnv(num_players=searcher.env.num_players, copy_obs=False)
+    worker.workers = 1
+    worker._executor = None
+    worker._searchers = None
+
+    return worker
+
+
+def _thread_search(worker, observation, seed, deadline):
+    """
+    Run one thread worker's search with its own Generator.
+    """
+    worker.rng = np.random.default_rng(seed)
+    return worker.search(observation, deadline)
+
+
+# the agent copy of a process worker, kept for the life of the process
+_process_searcher = None
+
+
+def _init_process_search(searcher):
+    global _process_searcher
+    _process_searcher = _copy_searcher(searcher)
+
+
+def _process_search(observation, seed, deadline):
+    """
+    Run one process worker's search with its own Generator, on the worker's
+    own copy of the agent.
+    """
+    _process_searcher.rng = np.random.default_rng(seed)
+    return _process_searcher.search(observation, deadline)
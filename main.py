@@ -38,118 +38,357 @@ in some capacity for each of the agents behaviours. Current thoughts are:
       conversation between the agents, with the agenda driven by the RL agent.
     
     
+Running this file plays a single game and prints every step. To simulate
+many games without rendering, split across a pool of processes, use
+
+    python main.py --games 10000 --workers 4
+
+or call simulate() directly, which returns the win rates by role and by
+win condition along with the games per second. To record every step of the
+games for offline learning, see trajectory.py, use
+
+    python main.py --games 10000 --record games
+
+and to see where the time goes, in the env and in the agents
+
+    python main.py --games 1000 --profile
+
 
 
 @author: George
 """
 
+import argparse
+import multiprocessing
+import time
+
 import numpy as np
 
+import parameters
 from avalon_env import AvalonEnv
-from agents import agent
+from vec_avalon_env import VecAvalonEnv
+from agents import agent, random_policy
+from trajectory import TrajectoryWriter
+from instrumentation import StepProfiler
 
-env = AvalonEnv()
 
-observation, _ = env.reset()
+# how each game was won
+GOOD_WIN = 0            # good won three missions and Merlin survived
+EVIL_MISSIONS_WIN = 1   # evil failed three missions
+EVIL_ASSASSINATION_WIN = 2  # evil assassinated Merlin
 
-player_models = [agent(env.agents[i], env.roles[i], observation, {}) for i in env.agents]
+win_conditions = ['good missions', 'evil missions', 'evil assassination']
 
-# setting the secret knowldege of each agent
 
-for player in player_models:
-    player.secret_role_knowledge = env._get_secret_info(player.role)
+def get_win_condition(env):
+    """
+    The win condition of a finished game of env.
+    """
+    if env.assassin_kill:
+        return EVIL_ASSASSINATION_WIN
+    elif env.failed_missions >= 3:
+        return EVIL_MISSIONS_WIN
+    
+    return GOOD_WIN
 
 
-while env.dones == False:
-    
+def select_action(env, player_models, observation):
+    """
+    Collect the actions of every player for the current phase, and collate
+    them into the single action that env.step takes.
+    """
     
     if env.phase == 'proposal':
         
-        actions = []
+        # only the leader proposes a team, everybody else does nothing
+        return np.array(player_models[env.leader].select_action_proposal(observation))
         
-        # loop thgrough all players
-        for player in player_models:
-            
-            
-            # if the agent is the leader
-            if env.leader == player.agent_idx:
-                # let them propose a team
-                action = player.select_action_proposal(observation) # will be a list of size env.num_players
-                
-                # otherwise, vote a 0 (i.e. no vote)
-            else:
-                action = [0] * env.num_players
-                
-            actions.append(action)
+    elif env.phase == 'discussion':
         
-        action = np.array(actions).sum(axis = 0)
-            
+        # every player posts a message to the board
+        return np.array([player.select_action_discussion(observation) for player in player_models])
         
     elif env.phase == 'voting':
         
-        actions = []
         # collect all the individual votes before doing the step
-        for player in player_models:
-            
-            action = player.select_action_voting(observation)
-            
-            # collate the actions from each agent into one action in some way
-            actions.append(action)
-            
-            
-        action = np.array(actions)
-        
+        return np.array([player.select_action_voting(observation) for player in player_models])
     
     elif env.phase == 'mission':
         
-        actions = [0] * env.num_players
+        actions = [0] * env.num_players # always vote pass if not on the team
         
-        for i, player in enumerate(player_models):
-            
-            selected_player_idx = np.where(observation['proposed_team'] == 1)[0]
+        # only the players in the selected team take a mission action
+        for i in np.where(observation['proposed_team'] == 1)[0]:
+            actions[i] = player_models[i].select_action_mission(observation)
             
-            # if the agent is in the selected team
-            if player.agent_idx in np.where(observation['proposed_team'] == 1)[0]:
-                
-                action = player.select_action_mission(observation)
-                
-            else:
-                action = 0 # always vote pass if not on the team
-                
-            actions[i] = action
+        return np.array(actions)
+        
+    elif env.phase == 'assassination':
+        
+        # only the assassin chooses who to kill
+        return np.array(player_models[env.assassin_idx].select_action_assassination(observation))
     
-        action = np.array(actions)
+    # the game is over, the action is ignored
+    return np.zeros(env.num_players, dtype=np.int8)
+
+
+def spawn_seeds(seed, num_seeds, start=0):
+    """
+    Independent child SeedSequences of a seed, or of a SeedSequence, the
+    children start to start + num_seeds. The children are derived from the
+    spawn key rather than with spawn, which would advance a SeedSequence
+    passed in, so the same seed always gives the same children and a game
+    can be replayed from its stored seed.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
         
+    return [np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,), pool_size=seed.pool_size)
+            for i in range(start, start + num_seeds)]
+
+
+def play_game(env, seed=None, writer=None):
+    """
+    Reset the env and play one game of random agents through to the end.
+    If a trajectory.TrajectoryWriter is given every step of the game is
+    recorded to it. If the env has a profiler, the agents' decisions are
+    timed by it too, as policy.<phase>.
+    
+    The env and the agents get their own Generators spawned from seed, so
+    the same seed always plays the same game, in any process. The agents of
+    one game share a Generator, as spawning one per agent costs more than
+    the rest of the game.
+    
+    Returns whether evil won, the win condition, the roles and the number of
+    missions played.
+    """
+    env_seed, agents_seed = spawn_seeds(seed, 2)
+    agents_rng = np.random.default_rng(agents_seed)
+    
+    observation, _ = env.reset(seed=int(env_seed.generate_state(1)[0]))
+    
+    # each agent is given its secret knowldege of the other players' roles
+    player_models = [agent(env.agents[i], env.roles[i], observation, env.secret_info[i],
+                           rng=agents_rng) for i in env.agents]
+    
+    if writer is not None:
+        writer.begin_game(env)
+    
+    profiler = env.profiler
+    
+    while env.dones == False:
         
-    elif env.phase == 'assassination':
-                    
-        actions = []
+        if profiler is not None:
+            token = profiler.start()
         
-        # loop thgrough all players
-        for player in player_models:
-            
-            
-            # if the agent is the leader
-            if player.agent_idx == env.assassin_idx:
-                # let them prpose a kill
-                
-                action = player.select_action_assassination(observation) # will be a list of size env.num_players
-                
-                # otherwise, vote a 0 (i.e. no vote)
-            else:
-                action = [0] * env.num_players
-                
-            actions.append(action)
+        action = select_action(env, player_models, observation)
+        
+        if profiler is not None:
+            profiler.stop('policy.' + env.phase, token)
+        
+        # the step in game over does nothing, so is not recorded
+        if writer is not None and env.phase != 'game_over':
+            writer.append(observation, action, env.phase_to_int(env.phase))
+            recorded = True
+        else:
+            recorded = False
+        
+        observation, reward, terminated, truncated, info = env.step(action)
         
-        action = np.array(actions).sum(axis = 0)
+        if recorded:
+            writer.outcome(reward, env.phase == 'game_over')
+        
+    win_condition = get_win_condition(env)
+        
+    evil_win = win_condition != GOOD_WIN
+    missions = env.successful_missions + env.failed_missions
+    
+    return evil_win, win_condition, env.roles.copy(), missions
+
+
+def play_games(num_games, seed, batched=False, num_players=8):
+    """
+    Play a chunk of games in one worker, with its own env and no rendering.
+    
+    Returns the per game results as arrays, to be sent back in one go.
+    """
+    if batched:
+        return play_games_batched(num_games, seed, num_players)
     
-    observation, reward, terminated, truncated, info = env.step(action)
+    # the agents only read the observation, so it does not need copying
+    env = AvalonEnv(num_players=num_players, render_mode=None, copy_obs=False)
+    game_seeds = spawn_seeds(seed, num_games)
+    
+    evil_wins = np.zeros(num_games, dtype=bool)
+    win_condition = np.zeros(num_games, dtype=np.int8)
+    roles = np.zeros((num_games, env.num_players), dtype=np.int8)
+    missions = np.zeros(num_games, dtype=np.int8)
+    
+    for game in range(num_games):
+        evil_wins[game], win_condition[game], roles[game], missions[game] = play_game(env, game_seeds[game])
         
+    return evil_wins, win_condition, roles, missions
 
 
+def play_games_batched(num_games, seed, num_players=8):
+    """
+    Play a chunk of games all at once in a VecAvalonEnv, with random_policy
+    deciding for every seat of every game in one call per step.
+    
+    Each game in the batch is only counted the first time it finishes.
+    """
+    env_seed, policy_seed = spawn_seeds(seed, 2)
+    
+    env = VecAvalonEnv(num_envs=num_games, num_players=num_players, seed=env_seed)
+    policy = random_policy(env.num_players, np.random.default_rng(policy_seed))
+    
+    finished = np.zeros(num_games, dtype=bool)
+    
+    evil_wins = np.zeros(num_games, dtype=bool)
+    win_condition = np.zeros(num_games, dtype=np.int8)
+    roles = np.zeros((num_games, env.num_players), dtype=np.int8)
+    missions = np.zeros(num_games, dtype=np.int8)
+    
+    while not finished.all():
+        
+        actions = policy.act(env.phase, env.seat_observations)
+        
+        observation, rewards, terminated, truncated, info = env.step(actions)
+        
+        games = np.flatnonzero(terminated & ~finished)
+        
+        evil_wins[games] = info['evil_win'][games]
+        win_condition[games] = np.where(info['assassin_kill'][games], EVIL_ASSASSINATION_WIN,
+                                        np.where(info['evil_win'][games], EVIL_MISSIONS_WIN, GOOD_WIN))
+        roles[games] = info['roles'][games]
+        missions[games] = info['missions'][games]
+        
+        finished[games] = True
+        
+    return evil_wins, win_condition, roles, missions
 
 
+def _play_games(args):
+    return play_games(*args)
 
 
+def simulate(num_games, workers=1, seed=None, chunk_size=100, on_chunk=None, batched=False, num_players=8):
+    """
+    Simulate num_games games of random agents, split into chunks of
+    chunk_size games over a pool of worker processes. With batched=True each
+    chunk is played at once in a VecAvalonEnv by random_policy, rather than
+    one game at a time with one agent per player.
+    
+    Results are streamed back one chunk at a time as they finish, and passed
+    to on_chunk if it is given. Returns the aggregated win rates by role and
+    by win condition, along with the games per second.
+    """
+    # every chunk gets its own seed, so no two workers play the same games,
+    # and the games played only depend on the seed and not the workers
+    seeds = spawn_seeds(seed, (num_games + chunk_size - 1) // chunk_size)
+    
+    chunks = []
+    for i, chunk_seed in enumerate(seeds):
+        size = min(chunk_size, num_games - i * chunk_size)
+        chunks.append((size, chunk_seed, batched, num_players))
+    
+    role_games = np.zeros(parameters.num_role_codes, dtype=np.int64)
+    role_wins = np.zeros(parameters.num_role_codes, dtype=np.int64)
+    condition_counts = np.zeros(len(win_conditions), dtype=np.int64)
+    
+    start = time.perf_counter()
+    
+    if workers == 1:
+        results = map(_play_games, chunks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_play_games, chunks)
+    
+    try:
+        for chunk in results:
+            
+            evil_wins, win_condition, roles, missions = chunk
+            
+            # a player won if their team won
+            won = parameters.is_evil[roles] == evil_wins[:, None]
+            
+            role_games += np.bincount(roles.ravel(), minlength=parameters.num_role_codes)
+            role_wins += np.bincount(roles.ravel(), weights=won.ravel(), minlength=parameters.num_role_codes).astype(np.int64)
+            condition_counts += np.bincount(win_condition, minlength=len(win_conditions))
+            
+            if on_chunk is not None:
+                on_chunk(chunk)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+            
+    elapsed = time.perf_counter() - start
+    
+    return {
+        'games': num_games,
+        'workers': workers,
+        'seconds': elapsed,
+        'games_per_second': num_games / elapsed,
+        'evil_win_rate': condition_counts[1:].sum() / num_games,
+        'win_rate_by_role': {name: role_wins[code] / role_games[code]
+                             for code, name in enumerate(parameters.role_names) if role_games[code] > 0},
+        'win_rate_by_condition': {name: condition_counts[code] / num_games
+                                  for code, name in enumerate(win_conditions)},
+    }
 
 
+if __name__ == '__main__':
+    
+    parser = argparse.ArgumentParser(description='Play games of Avalon between random agents.')
+    parser.add_argument('--games', type=int, default=0, help='number of games to simulate, 0 plays one rendered game')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--batched', action='store_true', help='play each chunk at once in a VecAvalonEnv')
+    parser.add_argument('--players', type=int, default=8, help='number of players, 5 to 10')
+    parser.add_argument('--record', default=None, help='record the trajectories of the games to this directory')
+    parser.add_argument('--profile', action='store_true', help='profile the env and the agents, in this process')
+    parser.add_argument('--profile-allocations', action='store_true', help='also count allocations, which is slow')
+    args = parser.parse_args()
+    
+    if args.games == 0:
+        play_game(AvalonEnv(num_players=args.players, render_mode='human'), seed=args.seed)
+        
+    elif args.record is not None:
+        
+        # games are recorded one at a time into a single dataset
+        env = AvalonEnv(num_players=args.players, render_mode=None, copy_obs=False)
+        
+        with TrajectoryWriter(args.record, num_players=args.players) as writer:
+            for game_seed in spawn_seeds(args.seed, args.games):
+                play_game(env, game_seed, writer)
+                
+        print(f"Recorded {writer.num_steps} steps of {writer.num_games} games to {args.record}")
+        
+    elif args.profile:
+        
+        # games are played one at a time in this process, with every step and
+        # decision timed
+        profiler = StepProfiler(track_allocations=args.profile_allocations)
+        env = AvalonEnv(num_players=args.players, render_mode=None, copy_obs=False, profiler=profiler)
+        
+        for game_seed in spawn_seeds(args.seed, args.games):
+            play_game(env, game_seed)
+            
+        print(profiler.summary())
+        
+    else:
+        results = simulate(args.games, workers=args.workers, seed=args.seed,
+                           chunk_size=args.chunk_size, batched=args.batched, num_players=args.players)
+        
+        print(f"Games: {results['games']} in {results['seconds']:.2f}s "
+              f"({results['games_per_second']:.0f} games/s with {results['workers']} workers)")
+        print(f"Evil win rate: {results['evil_win_rate']:.3f}")
+        
+        for name, rate in results['win_rate_by_role'].items():
+            print(f"  {name}: {rate:.3f}")
+            
+        for name, rate in results['win_rate_by_condition'].items():
+            print(f"  {name}: {rate:.3f}")
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+A flat, fixed layout encoding of the Avalon observation.
+
+Rather than a spaces.Dict which learners such as SB3 have to flatten on
+every step, the observation is laid out as one contiguous vector. Discrete
+entries are one hot encoded and binary arrays are copied in as they are.
+The offset of every field is computed once when the layout is built.
+
+    phase               - one hot, num_phases
+    current_round       - one hot, num_rounds
+    leader              - one hot, num_players
+    mission_size        - one hot, max_mission_size + 1
+    successful_missions - one hot, num_rounds + 1
+    failed_missions     - one hot, num_rounds + 1
+    proposed_team       - bits, num_players
+    votes               - bits, num_players
+    votes_history       - bits, num_rounds * num_players
+    mission_history     - bits, num_rounds
+
+With a discussion phase (message_len > 0) the message board is added too,
+the token ids copied in as they are rather than one hot encoded, so the
+Box space bounds them by vocab_size - 1 instead of 1.
+
+    message_cursor      - one hot, message_history
+    message_board       - tokens, num_players * message_len
+    message_history     - tokens, message_history * num_players * message_len
+
+@author: sggjone5
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from gymnasium import spaces
+
+
+class ObsLayout():
+    """
+    The field offsets of the flat observation vector.
+    """
+
+    def __init__(self, num_players=8, num_rounds=5, max_mission_size=5, num_phases=5,
+                 message_len=0, message_history=0, vocab_size=1):
+
+        self.num_players = num_players
+        self.num_rounds = num_rounds
+        self.vocab_size = vocab_size
+
+        # one hot fields and their sizes
+        self.one_hot_fields = [
+            ('phase', num_phases),
+            ('current_round', num_rounds),
+            ('leader', num_players),
+            ('mission_size', max_mission_size + 1),
+            ('successful_missions', num_rounds + 1),
+            ('failed_missions', num_rounds + 1),
+        ]
+
+        # binary array fields and their shapes
+        self.bit_fields = [
+            ('proposed_team', (num_players,)),
+            ('votes', (num_players,)),
+            ('votes_history', (num_rounds, num_players)),
+            ('mission_history', (num_rounds,)),
+        ]
+
+        # token fields of the discussion phase and their shapes
+        self.token_fields = []
+
+        if message_len > 0:
+            self.one_hot_fields.append(('message_cursor', message_history))
+            self.token_fields = [
+                ('message_board', (num_players, message_len)),
+                ('message_history', (message_history, num_players, message_len)),
+            ]
+
+        # compute the offsets of each field
+        self.offsets = {}
+        self.slices = {}
+        offset = 0
+
+        for name, size in self.one_hot_fields:
+            self.offsets[name] = offset
+            self.slices[name] = slice(offset, offset + size)
+            offset += size
+
+        self.shapes = {}
+        for name, shape in self.bit_fields + self.token_fields:
+            size = int(np.prod(shape))
+            self.offsets[name] = offset
+            self.slices[name] = slice(offset, offset + size)
+            self.shapes[name] = shape
+            offset += size
+
+        self.size = offset
+
+        # (offset, field) pairs used when encoding, to avoid dict lookups
+        self._one_hot = [(self.offsets[name], name) for name, _ in self.one_hot_fields]
+        self._bits = [(self.slices[name], name) for name, _ in self.bit_fields + self.token_fields]
+
+
+    def space(self, dtype=np.float32):
+        """
+        The Box space of the flat observation.
+        """
+        if not self.token_fields:
+            return spaces.Box(low=0, high=1, shape=(self.size,), dtype=dtype)
+
+        high = np.ones(self.size, dtype=dtype)
+        for name, _ in self.token_fields:
+            high[self.slices[name]] = self.vocab_size - 1
+
+        return spaces.Box(low=0, high=high, dtype=dtype)
+
+
+    def encode(self, observation, out=None, dtype=np.float32):
+        """
+        Encode a dict observation into the flat vector, in place if out is
+        given.
+        """
+        if out is None:
+            out = np.zeros(self.size, dtype=dtype)
+        else:
+            out.fill(0)
+
+        for offset, name in self._one_hot:
+            out[offset + observation[name]] = 1
+
+        for field_slice, name in self._bits:
+            out[field_slice] = np.ravel(observation[name])
+
+        return out
+
+
+    def decode(self, vector):
+        """
+        Decode a flat vector back into a dict observation.
+        """
+        observation = {}
+
+        for name, _ in self.one_hot_fields:
+            observation[name] = int(np.argmax(vector[self.slices[name]]))
+
+        for name, shape in self.bit_fields:
+            observation[name] = vector[self.slices[name]].reshape(shape).astype(np.int8)
+
+        for name, shape in self.token_fields:
+            observation[name] = vector[self.slices[name]].reshape(shape).astype(np.int32)
+
+        observation['num_players'] = self.num_players
+
+        return observation
+
+
+@lru_cache(maxsize=None)
+def get_layout(num_players=8, num_rounds=5, max_mission_size=5, num_phases=5,
+               message_len=0, message_history=0, vocab_size=1):
+    """
+    The cached ObsLayout of a configuration, shared between envs, so nothing
+    in it should be changed.
+    """
+    return ObsLayout(num_players, num_rounds, max_mission_size, num_phases,
+                     message_len, message_history, vocab_size)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+A compact, hashable game state for the Avalon environment.
+
+The game state spread across AvalonEnv (round, leader, phase, mission
+counts, proposed team, votes, histories and roles) is packed into three
+Python integers, so millions of positions can be stored as dict keys in
+search and caching code without keeping dicts and NumPy arrays around.
+
+    state   - phase, round, leader, mission counts, end of game flags, the
+              mission history and the proposed team and votes bitmasks,
+              at most 55 bits for up to 16 players
+    history - the votes history bitmask, player i of round r at bit
+              r * num_players + i
+    roles   - 3 bits of role code per player, player i at bit 3 * i
+
+With a discussion phase the message board, history and count are kept as
+one bytes string in messages, which is None otherwise. Likewise with
+game_log=True the rows of the game log are kept as bytes in log.
+
+The hash is computed once when the state is built, so hashing and equality
+are O(1).
+
+@author: sggjone5
+"""
+
+import numpy as np
+
+from avalon_env import AvalonEnv
+
+
+# bit offsets of each field in the state word
+PHASE_SHIFT = 0         # 3 bits
+ROUND_SHIFT = 3         # 3 bits
+LEADER_SHIFT = 6        # 4 bits
+SUCCESSES_SHIFT = 10    # 3 bits
+FAILS_SHIFT = 13        # 3 bits
+KILL_SHIFT = 16         # 1 bit
+DONES_SHIFT = 17        # 1 bit
+MISSIONS_SHIFT = 18     # 5 bits
+TEAM_SHIFT = 23         # num_players bits, followed by the votes
+
+bit_weights = 1 << np.arange(64, dtype=np.int64)[:63]
+role_weights = 8 ** np.arange(16, dtype=np.int64)
+
+
+def _pack_bits(bits):
+    return int(np.ravel(bits) @ bit_weights[:np.size(bits)])
+
+
+def _unpack_bits(word, size):
+    return ((word >> np.arange(size, dtype=np.int64)) & 1).astype(np.int8)
+
+
+class PackedState():
+    """
+    The full game state of an AvalonEnv packed into integers.
+    """
+
+    __slots__ = ('state', 'history', 'roles', 'messages', 'log', '_hash')
+
+    def __init__(self, state, history, roles, messages=None, log=None):
+
+        self.state = state
+        self.history = history
+        self.roles = roles
+        self.messages = messages
+        self.log = log
+        self._hash = hash((state, history, roles, messages, log))
+
+
+    def __hash__(self):
+        return self._hash
+
+
+    def __eq__(self, other):
+        return (isinstance(other, PackedState) and self._hash == other._hash
+                and self.state == other.state and self.history == other.history
+                and self.roles == other.roles and self.messages == other.messages
+                and self.log == other.log)
+
+
+    def __repr__(self):
+        return f'PackedState(state={self.state:#x}, history={self.history:#x}, roles={self.roles:#x})'
+
+
+    @classmethod
+    def from_env(cls, env):
+        """
+        Pack the current game state of env.
+        """
+        num_players = env.num_players
+
+        state = (
+            env.phase_dict[env.phase] << PHASE_SHIFT
+            | env.current_round << ROUND_SHIFT
+            | env.leader << LEADER_SHIFT
+            | env.successful_missions << SUCCESSES_SHIFT
+            | env.failed_missions << FAILS_SHIFT
+            | bool(env.assassin_kill) << KILL_SHIFT
+            | bool(env.dones) << DONES_SHIFT
+            | _pack_bits(env.mission_history) << MISSIONS_SHIFT
+            | _pack_bits(env.proposed_team) << TEAM_SHIFT
+            | _pack_bits(env.votes) << (TEAM_SHIFT + num_players)
+        )
+
+        history = _pack_bits(env.votes_history)
+        roles = int(env.roles @ role_weights[:num_players])
+
+        messages = None
+        if env.discussion:
+            messages = (env.message_board.tobytes() + env.message_history.tobytes()
+                        + env.message_count.to_bytes(8, 'little'))
+
+        log = env.game_log.to_bytes() if env.game_log is not None else None
+
+        return cls(state, history, roles, messages, log)
+
+
+    def public_key(self):
+        """
+        The state without the roles, what every player can see.
+        """
+        key = (self.state, self.history)
+
+        if self.messages is not None:
+            key += (self.messages,)
+
+        if self.log is not None:
+            key += (self.log,)
+
+        return key
+
+
+    def restore(self, env):
+        """
+        Restore this game state into env, in place.
+        """
+        num_players = env.num_players
+        state = self.state
+
+        env.phase = AvalonEnv.phase_names[(state >> PHASE_SHIFT) & 0b111]
+        env.rendering_phase = env.phase
+        env.current_round = (state >> ROUND_SHIFT) & 0b111
+        env.leader = (state >> LEADER_SHIFT) & 0b1111
+        env.successful_missions = (state >> SUCCESSES_SHIFT) & 0b111
+        env.failed_missions = (state >> FAILS_SHIFT) & 0b111
+        env.assassin_kill = bool((state >> KILL_SHIFT) & 1)
+        env.dones = bool((state >> DONES_SHIFT) & 1)
+
+        env.mission_history[:] = _unpack_bits(state >> MISSIONS_SHIFT, env.num_rounds)
+        env.proposed_team[:] = _unpack_bits(state >> TEAM_SHIFT, num_players)
+        env.votes[:] = _unpack_bits(state >> (TEAM_SHIFT + num_players), num_players)
+        env.votes_history[:] = _unpack_bits(self.history, env.votes_history.size).reshape(env.votes_history.shape)
+
+        if self.messages is not None:
+            board_size = env.message_board.nbytes
+            history_size = env.message_history.nbytes
+
+            env.message_board[:] = np.frombuffer(self.messages, env.message_board.dtype, env.message_board.size).reshape(
+                env.message_board.shape)
+            env.message_history[:] = np.frombuffer(self.messages, env.message_history.dtype, env.message_history.size,
+                                                   board_size).reshape(env.message_history.shape)
+            env.message_count = int.from_bytes(self.messages[board_size + history_size:], 'little')
+
+        if self.log is not None:
+            env.game_log.load_bytes(self.log)
+            env._refresh_log_window()
+
+        # the role lookups are only rebuilt if the roles have changed
+        if int(env.roles @ role_weights[:num_players]) != self.roles:
+            env.set_roles((self.roles // role_weights[:num_players]) % 8)
+
+        # the rewards only exist once the game is over
+        if env.phase == 'game_over':
+            env.rewards = env.calculate_rewards(evil_win=env.assassin_kill or env.failed_missions >= 3)
+        else:
+            env.rewards = {}
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+A parallel multi-agent interface to the Avalon environment.
+
+AvalonEnv takes one collated action per phase, which main.py gathers from
+every agent. AvalonParallelEnv follows the PettingZoo ParallelEnv API
+instead, every seat is an agent named 'player_i', and step and reset take
+and return dicts keyed by agent name.
+
+Each agent observes a dict of
+
+    observation - the flat public observation (obs_encoding.ObsLayout),
+                  followed by the one hot of the agent's seat, its own role
+                  and its secret knowledge of every player's role
+    action_mask - the legal values of its Discrete action this step
+
+All seats are built in one pass into a (num_players, obs_size) matrix, the
+public part broadcast into every row and the private part written once per
+game, along with a (num_players, num_actions) mask matrix. The per agent
+dicts are built once and hold read only views of their rows, so the same
+dicts are returned, updated in place, every step.
+
+Every agent has the same Discrete action space, large enough for the
+biggest team table, meaning
+
+    proposal      - index of the team in the round's team table
+    voting        - 0 reject, 1 accept
+    mission       - 0 pass, 1 fail, only evil players may fail
+    assassination - index of the player to assassinate
+
+Seats which do not act in the current phase, everyone but the leader in a
+proposal for example, can only take the no-op action 0.
+
+@author: sggjone5
+"""
+
+import numpy as np
+
+from gymnasium import spaces
+
+import parameters
+from avalon_env import AvalonEnv
+
+
+class AvalonParallelEnv():
+    """
+    Every seat of an AvalonEnv as a separate agent acting in parallel.
+    """
+
+    metadata = {'render_modes': ['human', 'ansi'], 'name': 'avalon_parallel_v0'}
+
+    def __init__(self, num_players=8, render_mode=None):
+
+        self.env = AvalonEnv(num_players=num_players, render_mode=render_mode, copy_obs=False, obs_mode='flat')
+        self.num_players = num_players
+        self.render_mode = render_mode
+
+        self.possible_agents = list(self.env.agent_names)
+        self.agents = list(self.possible_agents)
+
+        # offsets of each part of the per seat observation
+        num_roles = parameters.num_role_codes
+        self.public_size = self.env.obs_layout.size
+        self.seat_offset = self.public_size
+        self.role_offset = self.seat_offset + num_players
+        self.knowledge_offset = self.role_offset + num_roles
+        self.obs_size = self.knowledge_offset + num_players * num_roles
+
+        self.num_actions = int(max(self.env.proposal_action_space.n, num_players))
+
+        self.observation_matrix = np.zeros((num_players, self.obs_size), dtype=np.float32)
+        self.mask_matrix = np.zeros((num_players, self.num_actions), dtype=np.int8)
+
+        # the seat one hot never changes
+        self.observation_matrix[:, self.seat_offset:self.role_offset] = np.eye(num_players)
+
+        self.observations = {
+            name: {
+                'observation': AvalonEnv._read_only(self.observation_matrix[i]),
+                'action_mask': AvalonEnv._read_only(self.mask_matrix[i]),
+            }
+            for i, name in enumerate(self.possible_agents)
+        }
+
+        self.observation_spaces = {
+            name: spaces.Dict({
+                'observation': spaces.Box(low=0, high=1, shape=(self.obs_size,), dtype=np.float32),
+                'action_mask': spaces.MultiBinary(self.num_actions),
+            })
+            for name in self.possible_agents
+        }
+        self.action_spaces = {name: spaces.Discrete(self.num_actions) for name in self.possible_agents}
+
+        # the dicts returned by step are built once, the rewards are only
+        # non zero when the game ends
+        self.zero_rewards = {name: 0 for name in self.possible_agents}
+        self.not_done = {name: False for name in self.possible_agents}
+        self.done = {name: True for name in self.possible_agents}
+        self.infos = {name: {} for name in self.possible_agents}
+
+        self.seats = np.arange(num_players)
+
+
+    def observation_space(self, agent):
+        return self.observation_spaces[agent]
+
+
+    def action_space(self, agent):
+        return self.action_spaces[agent]
+
+
+    def reset(self, seed=None, options=None):
+        """
+        Reset the game, returning the observations and infos of every agent.
+        """
+        env = self.env
+        env.reset(seed=seed, options=options)
+
+        self.agents = list(self.possible_agents)
+
+        # the private part of every seat only changes with the roles
+        roles = self.observation_matrix[:, self.role_offset:self.knowledge_offset]
+        roles[:] = env.roles[:, None] == np.arange(parameters.num_role_codes)
+        self.observation_matrix[:, self.knowledge_offset:] = env.secret_knowledge.reshape(self.num_players, -1)
+
+        self._build()
+
+        return self.observations, self.infos
+
+
+    def _build(self):
+        """
+        Update the public part of every seat's observation and the action
+        masks for the current phase, in one pass over all seats.
+        """
+        env = self.env
+        masks = self.mask_matrix
+
+        self.observation_matrix[:, :self.public_size] = env.flat_observation
+
+        masks.fill(0)
+
+        if env.phase == 'voting':
+            masks[:, :2] = 1
+
+        else:
+            # only the acting seats have anything other than the no-op
+            masks[:, 0] = 1
+
+            if env.phase == 'proposal':
+                round_mask = env.proposal_masks[env.current_round]
+                masks[env.leader, :len(round_mask)] = round_mask
+
+            elif env.phase == 'mission':
+                masks[:, 1] = env.proposed_team * env.evil_mask
+
+            elif env.phase == 'assassination':
+                masks[env.assassin_idx, :self.num_players] = env.assassination_mask
+
+
+    def step(self, actions):
+        """
+        Take the actions of every agent, a dict of Discrete actions keyed by
+        agent name where missing agents take the no-op. Returns the
+        observations, rewards, terminations, truncations and infos dicts.
+        """
+        env = self.env
+
+        action = np.array([actions.get(name, 0) for name in self.possible_agents], dtype=np.intp)
+
+        if not self.mask_matrix[self.seats, action].all():
+            illegal = [self.possible_agents[i] for i in np.flatnonzero(self.mask_matrix[self.seats, action] == 0)]
+            raise ValueError(f'Illegal actions for {illegal} in phase {env.phase}.')
+
+        # collate the agents' actions into the single action env.step takes
+        if env.phase == 'proposal':
+            env.step(action[env.leader])
+
+        elif env.phase == 'assassination':
+            target = np.zeros(self.num_players, dtype=np.int8)
+            target[action[env.assassin_idx]] = 1
+            env.step(target)
+
+        elif env.phase != 'game_over':
+            env.step(action.astype(np.int8))
+
+        self._build()
+
+        if env.phase == 'game_over':
+            self.agents = []
+            return self.observations, env.rewards, self.done, self.not_done, self.infos
+
+        return self.observations, self.zero_rewards, self.not_done, self.not_done, self.infos
+
+
+    def state(self):
+        """
+        The public state of the game, as the flat observation.
+        """
+        return self.env.flat_observation_view
+
+
+    def render(self):
+        return self.env.render()
+
+
+    def close(self):
+        self.env.close()
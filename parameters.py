@@ -5,9 +5,81 @@
  Allowing agents to access this common store that is unnecessary to 
  include as part of the observation or action space.
 
+ Roles are stored as int8 role codes throughout the game, the role names
+ are only used to decode them into something human readable.
+
 @author: sggjone5
 """
 
+import numpy as np
+
 # Creating the mappings
 good_roles = ['Merlin', 'Percival', 'Loyal Servant']
-evil_roles = ['Assassin', 'Mordred', 'Minion']
\ No newline at end of file
+evil_roles = ['Assassin', 'Mordred', 'Minion']
+
+# role codes, the index of each role in role_names
+role_names = good_roles + evil_roles
+MERLIN, PERCIVAL, LOYAL_SERVANT, ASSASSIN, MORDRED, MINION = range(len(role_names))
+num_role_codes = len(role_names)
+
+role_to_code = {name: code for code, name in enumerate(role_names)}
+
+# team lookups indexed by role code, e.g. is_evil[roles] gives the evil mask
+is_evil = np.array([name in evil_roles for name in role_names])
+is_good = ~is_evil
+
+# the roles of the 8 player setup
+roles_8_players = np.array([
+    MERLIN,         # Good
+    PERCIVAL,       # Good
+    LOYAL_SERVANT,  # Good
+    LOYAL_SERVANT,  # Good
+    LOYAL_SERVANT,  # Good
+    ASSASSIN,       # Evil
+    MORDRED,        # Evil
+    MINION,         # Evil
+], dtype=np.int8)
+
+
+def draw_roles(rng, num_games, roles=roles_8_players):
+    """
+    Draw the shuffled roles of num_games games at once from a numpy
+    Generator, returned as (num_games, num_players) role codes.
+    """
+    return rng.permuted(np.broadcast_to(roles, (num_games, len(roles))), axis=1)
+
+
+def decode_roles(roles):
+    """
+    Decode a role code, or an array of them, into the role names.
+    """
+    return np.array(role_names)[roles]
+
+
+# who knows whose identity, role_knowledge[viewer, target] is True if a
+# player with the viewer role knows the role of a player with the target role
+role_knowledge = np.zeros((num_role_codes, num_role_codes), dtype=bool)
+
+role_knowledge[MERLIN, [ASSASSIN, MINION]] = True    # Merlin knows all evil except Mordred
+role_knowledge[PERCIVAL, MERLIN] = True              # Percival knows who Merlin is
+role_knowledge[ASSASSIN, MINION] = True              # Assassin knows other evil, except Mordred
+role_knowledge[MINION, [ASSASSIN, MINION]] = True    # Minion knows other evil, except Mordred
+
+
+def secret_knowledge(roles):
+    """
+    Build the secret knowledge tensor from role codes of shape (..., num_players).
+    
+    Returns an int8 array of shape (..., num_players, num_players, num_role_codes),
+    where [i, j] is the one hot role code of player j if player i knows it,
+    and all zeros otherwise. Players are not included in their own knowledge.
+    """
+    roles = np.asarray(roles)
+    num_players = roles.shape[-1]
+    
+    sees = role_knowledge[roles[..., :, None], roles[..., None, :]]
+    sees &= ~np.eye(num_players, dtype=bool)
+    
+    one_hot_roles = roles[..., None, :, None] == np.arange(num_role_codes)
+    
+    return (sees[..., None] & one_hot_roles).astype(np.int8)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Closed form Monte Carlo rollouts of whole games between scripted policies.
+
+The random agents of agents.py make every decision independently of the
+game so far: the leader proposes a uniformly random team, every player
+accepts with a fixed probability, evil players on a mission fail it with a
+fixed probability and good players with another (zero for the agents), and
+the Assassin guesses a uniformly random player. Under such policies the seats
+never need to be simulated. Which players are evil only matters through how
+many of them a random team holds, which is hypergeometric, so each round
+reduces to a few probabilities computed once:
+
+    pass    - P(more than half of num_players accept), the same every
+              proposal, so the rejections of a game of m missions are
+              negative binomial with m successes
+    fail    - P(at least fails_required fails), summed over the evil
+              players on the team, with the fails of evil and good binomial
+
+rollout_games then draws every game at once as whole array operations,
+rather than stepping through the phases. The rules are those of AvalonEnv
+for the player count, including its quirk on a 2, 2 draw, after which the
+round is undone so the fifth mission is played as the fourth, with its size
+and its two fails needed from 7 players. There is no five rejection rule.
+For example
+
+    python rollout.py --games 10000000
+
+@author: sggjone5
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import rules
+import main
+
+
+# the behaviour of the random agents in agents.agent
+default_policy_params = {
+    'accept_prob': 0.5,         # probability each player accepts a team
+    'evil_fail_prob': 0.5,      # probability an evil player fails a mission
+    'good_fail_prob': 0.0,      # probability a good player fails a mission
+    'merlin_hit_prob': None,    # probability the Assassin finds Merlin, None for 1 / num_players
+}
+
+# the round index each mission is played at, the fifth mission only
+# happens from 2, 2, where AvalonEnv undoes the round update
+mission_rounds = np.array([0, 1, 2, 3, 3])
+
+chunk_size = 1 << 20 # games drawn at once, bounding the memory used
+
+
+def _binomial_pmf(n, p):
+    return np.array([math.comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(n + 1)])
+
+
+def vote_pass_prob(num_players, accept_prob):
+    """
+    The probability a proposal passes, more than half of the players
+    accepting.
+    """
+    return _binomial_pmf(num_players, accept_prob)[num_players // 2 + 1:].sum()
+
+
+def mission_fail_probs(game_rules, evil_fail_prob, good_fail_prob):
+    """
+    The probability the mission of each round fails, for a uniformly random
+    team.
+    """
+    num_players, num_evil = game_rules.num_players, game_rules.num_evil
+
+    fail_probs = np.zeros(game_rules.num_rounds)
+
+    for round_idx, size in enumerate(game_rules.mission_sizes):
+        for evil in range(min(size, num_evil) + 1):
+
+            # evil players on the team, hypergeometric
+            team_prob = math.comb(num_evil, evil) * math.comb(num_players - num_evil, size - evil) \
+                        / math.comb(num_players, size)
+
+            # fails from evil and good players
+            fails = np.convolve(_binomial_pmf(evil, evil_fail_prob), _binomial_pmf(size - evil, good_fail_prob))
+
+            fail_probs[round_idx] += team_prob * fails[game_rules.fails_required[round_idx]:].sum()
+
+    return fail_probs
+
+
+def rollout_games(n, policy_params=None, rng=None, num_players=8):
+    """
+    Play n games between the policies of policy_params, which override
+    default_policy_params. rng is a Generator or anything default_rng takes.
+
+    Returns a dict of arrays with one entry per game:
+
+        evil_win        - whether evil won
+        win_condition   - main.GOOD_WIN, EVIL_MISSIONS_WIN or EVIL_ASSASSINATION_WIN
+        rounds          - missions played
+        rejections      - proposals rejected
+    """
+    params = dict(default_policy_params, **(policy_params or {}))
+    rng = np.random.default_rng(rng)
+
+    game_rules = rules.get_rules(num_players)
+
+    pass_prob = vote_pass_prob(num_players, params['accept_prob'])
+    fail_probs = mission_fail_probs(game_rules, params['evil_fail_prob'], params['good_fail_prob'])
+
+    merlin_hit_prob = params['merlin_hit_prob']
+    if merlin_hit_prob is None:
+        merlin_hit_prob = 1 / num_players
+
+    if pass_prob == 0:
+        raise ValueError('No proposal can ever pass, so no game would end.')
+
+    # the fail probability of each mission, as its uniform draws are compared to it
+    mission_fail_probs_32 = fail_probs[mission_rounds].astype(np.float32)[:, None]
+    missions = np.arange(1, len(mission_rounds) + 1, dtype=np.int8)[:, None]
+
+    win_condition = np.empty(n, dtype=np.int8)
+    rounds = np.empty(n, dtype=np.int8)
+    rejections = np.empty(n, dtype=np.int64)
+
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        size = end - start
+
+        # every mission of every game is drawn, then the game ends at the
+        # first mission with three fails or three successes
+        failed = rng.random((len(mission_rounds), size), dtype=np.float32) < mission_fail_probs_32
+
+        fails = np.cumsum(failed, axis=0, dtype=np.int8)
+        finished = (fails == 3) | (missions - fails == 3)
+
+        played = np.argmax(finished, axis=0)
+        evil_missions = fails[played, np.arange(size)] == 3
+
+        # with three successes the Assassin guesses
+        kill = rng.random(size, dtype=np.float32) < merlin_hit_prob
+
+        win_condition[start:end] = np.where(evil_missions, main.EVIL_MISSIONS_WIN,
+                                            np.where(kill, main.EVIL_ASSASSINATION_WIN, main.GOOD_WIN))
+        rounds[start:end] = played + 1
+
+        # rejections before each of the played missions passed
+        rejections[start:end] = rng.negative_binomial(rounds[start:end], pass_prob)
+
+    return {
+        'evil_win': win_condition != main.GOOD_WIN,
+        'win_condition': win_condition,
+        'rounds': rounds,
+        'rejections': rejections,
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Roll out games of Avalon between the random agents in closed form.')
+    parser.add_argument('--games', type=int, default=1000000)
+    parser.add_argument('--players', type=int, default=8, help='number of players, 5 to 10')
+    parser.add_argument('--accept-prob', type=float, default=0.5)
+    parser.add_argument('--evil-fail-prob', type=float, default=0.5)
+    parser.add_argument('--good-fail-prob', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    policy_params = {'accept_prob': args.accept_prob, 'evil_fail_prob': args.evil_fail_prob,
+                     'good_fail_prob': args.good_fail_prob}
+
+    start = time.perf_counter()
+    results = rollout_games(args.games, policy_params, args.seed, num_players=args.players)
+    elapsed = time.perf_counter() - start
+
+    print(f"Games: {args.games} in {elapsed:.2f}s ({args.games / elapsed:,.0f} games/s)")
+    print(f"Evil win rate: {results['evil_win'].mean():.4f}")
+
+    for code, name in enumerate(main.win_conditions):
+        print(f"  {name}: {np.mean(results['win_condition'] == code):.4f}")
+
+    print(f"Mean missions: {results['rounds'].mean():.3f}, mean rejections: {results['rejections'].mean():.3f}")
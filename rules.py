@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+The rules of Avalon for every official player count, 5 to 10 players.
+
+    players  good  evil  mission sizes     two fails needed on mission 4
+       5      3     2    2, 3, 2, 3, 3     no
+       6      4     2    2, 3, 4, 3, 4     no
+       7      4     3    2, 3, 3, 4, 4     yes
+       8      5     3    3, 4, 4, 5, 5     yes
+       9      6     3    3, 4, 4, 5, 5     yes
+      10      6     4    3, 4, 4, 5, 5     yes
+
+Merlin, Percival and the Assassin are in every game. Evil is filled out
+with a Minion for 5 and 6 players, Mordred and a Minion for 7 to 9 players,
+and Mordred and two Minions for 10 players. The rest of good are Loyal
+Servants.
+
+get_rules compiles a GameRules for a player count once and caches it, so
+every env of that size shares the same read only arrays, team tables and
+spaces rather than building its own.
+
+@author: sggjone5
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from gymnasium import spaces
+
+import game_log
+import parameters
+import team_tables
+from parameters import MERLIN, PERCIVAL, LOYAL_SERVANT, ASSASSIN, MORDRED, MINION
+
+
+# players: (mission sizes, special good roles, evil roles)
+rules_table = {
+    5: ((2, 3, 2, 3, 3), (MERLIN, PERCIVAL), (ASSASSIN, MINION)),
+    6: ((2, 3, 4, 3, 4), (MERLIN, PERCIVAL), (ASSASSIN, MINION)),
+    7: ((2, 3, 3, 4, 4), (MERLIN, PERCIVAL), (ASSASSIN, MORDRED, MINION)),
+    8: ((3, 4, 4, 5, 5), (MERLIN, PERCIVAL), (ASSASSIN, MORDRED, MINION)),
+    9: ((3, 4, 4, 5, 5), (MERLIN, PERCIVAL), (ASSASSIN, MORDRED, MINION)),
+    10: ((3, 4, 4, 5, 5), (MERLIN, PERCIVAL), (ASSASSIN, MORDRED, MINION, MINION)),
+}
+
+# from 7 players on, the fourth mission needs two fails to fail
+two_fails_min_players = 7
+two_fails_round = 3 # zero-indexed
+
+num_rounds = 5
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class GameRules():
+    """
+    The rules of one player count along with every lookup derived from
+    them. Shared between envs, so nothing in it should be changed.
+    """
+
+    def __init__(self, num_players):
+
+        if num_players not in rules_table:
+            raise ValueError(f'Avalon is played with {min(rules_table)} to {max(rules_table)} players, '
+                             f'not {num_players}.')
+
+        mission_sizes, good_roles, evil_roles = rules_table[num_players]
+
+        self.num_players = num_players
+        self.num_rounds = num_rounds
+        self.num_evil = len(evil_roles)
+        self.num_good = num_players - self.num_evil
+
+        self.mission_sizes = mission_sizes
+        self.mission_size_array = _read_only(np.array(mission_sizes, dtype=np.int8))
+        self.max_mission_size = max(mission_sizes)
+
+        # None if no mission needs two fails
+        self.two_fails_required_round = two_fails_round if num_players >= two_fails_min_players else None
+
+        # fails needed to fail each mission
+        self.fails_required = np.ones(num_rounds, dtype=np.int8)
+        if self.two_fails_required_round is not None:
+            self.fails_required[self.two_fails_required_round] = 2
+        _read_only(self.fails_required)
+
+        # the roles of the game as role codes, good before evil
+        servants = (LOYAL_SERVANT,) * (self.num_good - len(good_roles))
+        self.roles = _read_only(np.array(good_roles + servants + evil_roles, dtype=np.int8))
+
+        # how many of each role code are in the game
+        self.role_counts = _read_only(np.bincount(self.roles, minlength=parameters.num_role_codes))
+
+        # every legal team of each round, and the legal Discrete proposals
+        self.team_tables = [team_tables.team_table(num_players, size) for size in mission_sizes]
+        self.proposal_masks = team_tables.proposal_masks(num_players, mission_sizes)
+
+        # the spaces which only depend on the player count
+        self.proposal_action_space = spaces.Discrete(self.proposal_masks.shape[1])
+        self.private_observation_space = spaces.MultiBinary(num_players * parameters.num_role_codes)
+        self.action_space = spaces.MultiBinary(num_players + 1 + 1 + num_players)
+
+        self.observation_spaces = {
+            'current_round': spaces.Discrete(num_rounds),
+            'leader': spaces.Discrete(num_players),
+            'proposed_team': spaces.MultiBinary(num_players),
+            'votes': spaces.MultiBinary(num_players),
+            'votes_history': spaces.MultiBinary((num_rounds, num_players)),
+            'mission_history': spaces.MultiBinary(num_rounds),
+            'successful_missions': spaces.Discrete(num_rounds + 1),
+            'failed_missions': spaces.Discrete(num_rounds + 1),
+            'num_players': spaces.Discrete(num_players + 1),
+            'mission_size': spaces.Discrete(self.max_mission_size + 1),
+        }
+
+        # the window of the game log in the observation, with game_log=True
+        window = game_log.default_capacity
+        self.log_observation_spaces = {
+            'log_round': spaces.Box(0, num_rounds - 1, (window,), np.int8),
+            'log_leader': spaces.Box(0, num_players - 1, (window,), np.int8),
+            'log_team': spaces.MultiBinary((window, num_players)),
+            'log_votes': spaces.MultiBinary((window, num_players)),
+            'log_fails': spaces.Box(-1, self.max_mission_size, (window,), np.int8),
+            'log_length': spaces.Discrete(window + 1),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_rules(num_players=8):
+    """
+    The cached GameRules of num_players players.
+    """
+    return GameRules(num_players)
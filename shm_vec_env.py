@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+A multi-process vector env of AvalonEnvs, passing everything through shared
+memory.
+
+Wrapping AvalonEnv in a pipe based vector env such as SB3's SubprocVecEnv
+pickles every observation, reward and action through a pipe on every step,
+which for a step this cheap costs more than the step itself. ShmVecEnv
+instead lays out one multiprocessing.shared_memory block holding every
+array exchanged, with a (num_envs, ...) axis:
+
+    obs             - the flat observations, laid out by obs_encoding.ObsLayout
+    rewards         - (num_envs, num_players) terminal rewards
+    terminated      - games that finished on the last step
+    truncated       - always False, there is no turn limit
+    evil_win        - the winner of the games that finished
+    phase, mission_size, proposed_team, role
+                    - the seat observations agents.random_policy needs
+    actions         - the collated actions of every game
+    seeds           - the seeds of the next reset
+
+Every worker process runs a slice of the envs, each created with
+obs_buffer set to its row of obs, so an env encodes its observation
+straight into shared memory. A step is signalled with one semaphore release
+per worker, and each worker releases a shared semaphore once its envs have
+stepped, so no data is ever pickled. Running several envs per worker spreads
+the signalling cost over them.
+
+Games which finish are reset in place during the same step, as in
+VecAvalonEnv, so no extra step is needed in the 'game_over' phase. The
+terminal rewards are returned for that step and the observation is from the
+new game. The arrays returned are read only views of the shared memory,
+overwritten by the next step, so they must be copied to be kept.
+
+An exception in a worker, such as an invalid action, is raised from step
+as a RuntimeError holding the traceback of every worker that failed. The
+other games may have stepped already, so the envs should be reset after
+one.
+
+The discussion phase is not supported, as its actions are messages rather
+than one action per seat.
+
+@author: sggjone5
+"""
+
+import multiprocessing
+import os
+import queue
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from avalon_env import AvalonEnv
+import rules
+import main
+
+
+# worker commands
+STEP = 0
+RESET = 1
+CLOSE = 2
+
+alignment = 64 # bytes, so each array starts on its own cache line
+
+
+def shm_fields(num_envs, num_workers, obs_size, num_players=8, obs_dtype=np.float32):
+    """
+    The (name, shape, dtype) of every array in the shared memory block,
+    with observations obs_size long and a failed flag per worker.
+    """
+    return [
+        ('obs', (num_envs, obs_size), np.dtype(obs_dtype)),
+        ('rewards', (num_envs, num_players), np.dtype(np.float32)),
+        ('terminated', (num_envs,), np.dtype(bool)),
+        ('truncated', (num_envs,), np.dtype(bool)),
+        ('evil_win', (num_envs,), np.dtype(bool)),
+        ('phase', (num_envs,), np.dtype(np.int8)),
+        ('mission_size', (num_envs,), np.dtype(np.int8)),
+        ('proposed_team', (num_envs, num_players), np.dtype(np.int8)),
+        ('role', (num_envs, num_players), np.dtype(np.int8)),
+        ('actions', (num_envs, num_players), np.dtype(np.int8)),
+        ('seeds', (num_envs,), np.dtype(np.int64)),
+        ('reseed', (1,), np.dtype(bool)),
+        ('command', (1,), np.dtype(np.int8)),
+        ('failed', (num_workers,), np.dtype(bool)),
+    ]
+
+
+def shm_offsets(fields):
+    """
+    The byte offset of every field, and the total size of the block.
+    """
+    offsets = {}
+    offset = 0
+
+    for name, shape, dtype in fields:
+        offsets[name] = offset
+        offset += -(-int(np.prod(shape)) * dtype.itemsize // alignment) * alignment
+
+    return offsets, max(offset, 1)
+
+
+def shm_arrays(buffer, fields):
+    """
+    NumPy arrays of every field, backed by the shared memory buffer.
+    """
+    offsets, _ = shm_offsets(fields)
+
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offsets[name])
+            for name, shape, dtype in fields}
+
+
+def _worker(worker_idx, shm_name, fields, env_idxs, num_players, obs_dtype, command_ready, step_done, errors):
+    """
+    Run the envs env_idxs, stepping them on every command_ready release.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = shm_arrays(shm.buf, fields)
+
+    obs = arrays['obs']
+    rewards = arrays['rewards']
+    terminated = arrays['terminated']
+    evil_win = arrays['evil_win']
+    phase = arrays['phase']
+    mission_size = arrays['mission_size']
+    proposed_team = arrays['proposed_team']
+    role = arrays['role']
+    actions = arrays['actions']
+    seeds = arrays['seeds']
+
+    # every env encodes its observation straight into its row of obs
+    envs = [(e, AvalonEnv(num_players=num_players, render_mode=None, copy_obs=False, obs_mode='flat',
+                          obs_dtype=obs_dtype, obs_buffer=obs[e])) for e in env_idxs]
+
+    def write_state(e, env):
+        phase[e] = env.phase_dict[env.phase]
+        mission_size[e] = env.mission_sizes[env.current_round]
+        proposed_team[e] = env.proposed_team
+        role[e] = env.roles
+
+    try:
+        while True:
+            command_ready.acquire()
+            command = arrays['command'][0]
+
+            if command == CLOSE:
+                break
+
+            try:
+                for e, env in envs:
+
+                    if command == RESET:
+                        env.reset(seed=int(seeds[e]) if arrays['reseed'][0] else None)
+                        rewards[e] = 0
+                        terminated[e] = False
+                        evil_win[e] = False
+
+                    else:
+                        env.step(actions[e])
+
+                        # the game is over as soon as the rewards are set, so
+                        # it is reset rather than stepped through 'game_over'
+                        if env.phase == 'game_over':
+                            rewards[e] = [env.rewards[name] for name in env.agent_names]
+                            terminated[e] = True
+                            evil_win[e] = main.get_win_condition(env) != main.GOOD_WIN
+                            env.reset()
+
+                        else:
+                            rewards[e] = 0
+                            terminated[e] = False
+
+                    write_state(e, env)
+
+            except Exception:
+                arrays['failed'][worker_idx] = True
+                errors.put(f'env {e} in worker {os.getpid()}:\n{traceback.format_exc()}')
+
+            step_done.release()
+
+    finally:
+        # the arrays must be released before the block can be closed
+        del envs, write_state, arrays, obs, rewards, terminated, evil_win, phase, mission_size, proposed_team, role
+        del actions, seeds
+        shm.close()
+
+
+class ShmVecEnv():
+    """
+    Plays num_envs games of Avalon in num_workers processes, exchanging
+    actions and observations through shared memory.
+    """
+
+    def __init__(self, num_envs=8, num_workers=None, num_players=8, seed=None, obs_dtype=np.float32,
+                 context=None):
+        """
+        num_workers defaults to one per CPU, never more than num_envs, and
+        context is the multiprocessing start method, the platform default if
+        None.
+        """
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        num_workers = max(1, min(num_workers, num_envs))
+
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        self.num_players = num_players
+
+        self.rules = rules.get_rules(num_players)
+
+        # a single env's spaces, built from an env in this process
+        env = AvalonEnv(num_players=num_players, render_mode=None, obs_mode='flat', obs_dtype=obs_dtype)
+        self.single_observation_space = env.observation_space
+        self.single_action_space = env.action_space
+        self.obs_layout = env.obs_layout
+
+        self.fields = shm_fields(num_envs, num_workers, self.obs_layout.size, num_players, obs_dtype)
+        _, size = shm_offsets(self.fields)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = shm_arrays(self.shm.buf, self.fields)
+        self.arrays['failed'][:] = False
+
+        ctx = multiprocessing.get_context(context)
+
+        self.step_done = ctx.Semaphore(0)
+        self.errors = ctx.Queue()
+        self.command_ready = []
+        self.workers = []
+
+        # contiguous slices of the envs, as even as possible
+        for worker_idx, env_idxs in enumerate(np.array_split(np.arange(num_envs), num_workers)):
+            command_ready = ctx.Semaphore(0)
+            worker = ctx.Process(target=_worker, daemon=True,
+                                 args=(worker_idx, self.shm.name, self.fields, env_idxs.tolist(), num_players,
+                                       obs_dtype, command_ready, self.step_done, self.errors))
+            worker.start()
+
+            self.command_ready.append(command_ready)
+            self.workers.append(worker)
+
+        # read only views returned to the caller
+        self.observation = self._read_only(self.arrays['obs'])
+        self.rewards = self._read_only(self.arrays['rewards'])
+        self.terminated = self._read_only(self.arrays['terminated'])
+        self.truncated = self._read_only(self.arrays['truncated'])
+
+        self.seat_observations = {name: self._read_only(self.arrays[name])
+                                  for name in ('phase', 'mission_size', 'proposed_team', 'role')}
+
+        self.waiting = False
+        self.closed = False
+
+        self.reset(seed=seed)
+
+
+    @staticmethod
+    def _read_only(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+
+    def _send(self, command):
+        """
+        Signal every worker to run command.
+        """
+        self.arrays['command'][0] = command
+
+        for command_ready in self.command_ready:
+            command_ready.release()
+
+        self.waiting = True
+
+
+    def _wait(self):
+        """
+        Wait until every worker has finished its command, raising any error
+        a worker hit.
+        """
+        for _ in range(self.num_workers):
+            while not self.step_done.acquire(timeout=1.0):
+                if not all(worker.is_alive() for worker in self.workers):
+                    self.waiting = False
+                    raise RuntimeError('A ShmVecEnv worker has died.')
+
+        self.waiting = False
+
+        failed = self.arrays['failed']
+        num_failed = int(failed.sum())
+
+        if num_failed:
+            failed[:] = False
+
+            # a message is put on the queue before its worker signals, but
+            # only reaches it through the queue's feeder thread, so the ones
+            # expected are waited for
+            messages = []
+            try:
+                for _ in range(num_failed):
+                    messages.append(self.errors.get(timeout=5))
+            except queue.Empty:
+                pass
+
+            messages.extend(self._drain_errors())
+
+            raise RuntimeError(f'{num_failed} ShmVecEnv worker(s) failed stepping:\n' + '\n'.join(messages))
+
+
+    def _drain_errors(self):
+        """
+        Take every message left on the error queue.
+        """
+        messages = []
+
+        while True:
+            try:
+                messages.append(self.errors.get_nowait())
+            except queue.Empty:
+                return messages
+
+
+    def reset(self, seed=None):
+        """
+        Reset every game. With a seed, each env is reseeded from its own
+        SeedSequence spawned from it, so the games dealt do not depend on
+        the number of workers.
+        """
+        if self.waiting:
+            self._wait()
+
+        # errors from before the reset are stale
+        self._drain_errors()
+        self.arrays['failed'][:] = False
+
+        self.arrays['reseed'][0] = seed is not None
+
+        if seed is not None:
+            self.arrays['seeds'][:] = [s.generate_state(1)[0] for s in main.spawn_seeds(seed, self.num_envs)]
+
+        self._send(RESET)
+        self._wait()
+
+        return self.observation, {}
+
+
+    def step_async(self, actions):
+        """
+        Start a step of every game with the (num_envs, num_players) actions,
+        each exactly as AvalonEnv.step takes them.
+        """
+        self.arrays['actions'][:] = actions
+        self._send(STEP)
+
+
+    def step_wait(self):
+        """
+        Wait for the step started by step_async, returning the observation,
+        rewards, terminated and truncated flags and an info dict of the
+        winners of the finished games.
+        """
+        self._wait()
+
+        info = {'evil_win': self.arrays['evil_win'] & self.arrays['terminated']}
+
+        return self.observation, self.rewards, self.terminated, self.truncated, info
+
+
+    def step(self, actions):
+        """
+        Advance every game by one phase.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+
+    def close(self):
+        """
+        Stop the workers and free the shared memory.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+
+        if self.waiting:
+            try:
+                self._wait()
+            except RuntimeError:
+                pass
+
+        self._drain_errors()
+        self._send(CLOSE)
+
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+        # views still held by the caller keep the block mapped until they are
+        # dropped, but it is unlinked either way
+        self.arrays = self.observation = self.rewards = self.terminated = self.truncated = None
+        self.seat_observations = None
+
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+        self.shm.unlink()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed tables of every legal team for each mission size.
+
+For 8 players there are 56 teams of 3, 70 teams of 4 and 56 teams of 5. The
+tables are built once per (num_players, team size) and cached, so every env
+shares the same read only arrays. A team is stored three ways:
+
+    indices   - (num_teams, team_size) player indexes on the team
+    bitmasks  - (num_teams,) player i at bit i
+    teams     - (num_teams, num_players) binary team vectors, as taken by
+                AvalonEnv.step in the proposal phase
+
+so a Discrete proposal action is simply a row index into the table for the
+current mission size.
+
+@author: sggjone5
+"""
+
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class TeamTable():
+    """
+    Every team of one size, in lexicographic order of the player indexes.
+    """
+
+    def __init__(self, num_players, team_size):
+
+        self.num_players = num_players
+        self.team_size = team_size
+
+        combos = list(combinations(range(num_players), team_size))
+        self.indices = _read_only(np.array(combos, dtype=np.int8).reshape(len(combos), team_size))
+
+        self.teams = np.zeros((len(self.indices), num_players), dtype=np.int8)
+        np.put_along_axis(self.teams, self.indices.astype(np.intp), 1, axis=1)
+        _read_only(self.teams)
+
+        self.bitmasks = _read_only(self.teams.astype(np.int64) @ (1 << np.arange(num_players, dtype=np.int64)))
+
+        # team index from bitmask, for going back from a binary team vector
+        self.index_of = {int(mask): idx for idx, mask in enumerate(self.bitmasks)}
+
+    def __len__(self):
+        return len(self.indices)
+
+
+@lru_cache(maxsize=None)
+def team_table(num_players, team_size):
+    """
+    The cached TeamTable of every team of team_size players.
+    """
+    return TeamTable(num_players, team_size)
+
+
+@lru_cache(maxsize=None)
+def proposal_masks(num_players, mission_sizes):
+    """
+    (num_rounds, max_teams) bool masks of the legal Discrete proposal
+    actions in each round, where max_teams is the largest table size.
+    mission_sizes must be a tuple, so it can be cached.
+    """
+    counts = [len(team_table(num_players, size)) for size in mission_sizes]
+
+    masks = np.zeros((len(mission_sizes), max(counts)), dtype=bool)
+    for round_idx, count in enumerate(counts):
+        masks[round_idx, :count] = True
+
+    return _read_only(masks)
+
+
+@lru_cache(maxsize=None)
+def teams_by_size(num_players, max_team_size):
+    """
+    Every table stacked into one padded (max_team_size + 1, max_teams,
+    num_players) array, along with the number of teams of each size, for
+    drawing the teams of many games at once from their mission sizes.
+    """
+    tables = [team_table(num_players, size) for size in range(max_team_size + 1)]
+    counts = np.array([len(table) for table in tables])
+
+    padded = np.zeros((max_team_size + 1, counts.max(), num_players), dtype=np.int8)
+    for size, table in enumerate(tables):
+        padded[size, :len(table)] = table.teams
+
+    return _read_only(padded), _read_only(counts)
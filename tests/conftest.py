@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Lets the tests import the modules at the root of the repository.
+
+@author: sggjone5
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
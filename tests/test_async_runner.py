@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of AsyncRunner.
+
+@author: sggjone5
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from async_runner import AsyncRunner, latency_agent, latency_agents
+import main
+
+
+@pytest.mark.parametrize('num_players', [5, 10])
+def test_runs_player_count(num_players):
+
+    seen = []
+
+    def make_agents(env, observation, rng):
+        seen.append(env.num_players)
+        return latency_agents(latency=0.001)(env, observation, rng)
+
+    runner = AsyncRunner(make_agents, games_in_flight=4, env_kwargs={'num_players': num_players})
+    evil_wins, win_condition = asyncio.run(runner.run(8, seed=0))
+
+    assert seen == [num_players] * 8
+    assert len(evil_wins) == 8
+    assert np.isin(win_condition, range(len(main.win_conditions))).all()
+
+
+def test_runs_discussion_phase():
+
+    posted = []
+
+    class talking_agent(latency_agent):
+
+        async def select_action_discussion(self, observation):
+            posted.append(observation['message_board'].shape)
+            return await super().select_action_discussion(observation)
+
+    def make_agents(env, observation, rng):
+        return [talking_agent(i, env.roles[i], observation, env.secret_info[i], rng, latency=0.001)
+                for i in env.agents]
+
+    runner = AsyncRunner(make_agents, games_in_flight=4, env_kwargs={'discussion': True, 'max_msg_len': 4})
+    asyncio.run(runner.run(4, seed=0))
+
+    assert posted and set(posted) == {(8, 4)}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of AvalonEnv with game_log=True.
+
+@author: sggjone5
+"""
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+from packed_state import PackedState
+
+
+def _random_action(env, rng, reject=False):
+    """
+    A random legal action for the current phase, rejecting every proposal
+    if reject.
+    """
+    if env.phase == 'proposal':
+        return int(rng.integers(len(env.team_tables[env.current_round].teams)))
+
+    if env.phase == 'voting':
+        return np.zeros(env.num_players, dtype=np.int8) if reject else rng.integers(0, 2, env.num_players)
+
+    if env.phase == 'mission':
+        return env.proposed_team * rng.integers(0, 2, env.num_players)
+
+    target = np.zeros(env.num_players, dtype=np.int8)
+    target[rng.choice(np.flatnonzero(env.assassination_mask))] = 1
+    return target
+
+
+@pytest.mark.parametrize('num_players', [5, 8, 10])
+def test_observation_stays_in_space(num_players, num_games=20, seed=0):
+
+    rng = np.random.default_rng(seed)
+    env = AvalonEnv(num_players=num_players, render_mode=None, game_log=True)
+
+    for game in range(num_games):
+        observation, _ = env.reset(seed=game)
+        assert env.observation_space.contains(observation)
+
+        # every other game rejects its first 30 proposals, overflowing the window
+        while env.phase != 'game_over':
+            observation, _, _, _, _ = env.step(_random_action(env, rng, reject=game % 2 and len(env.game_log) < 30))
+            assert env.observation_space.contains(observation)
+
+
+def test_log_keeps_every_proposal(seed=0):
+
+    rng = np.random.default_rng(seed)
+    env = AvalonEnv(render_mode=None, game_log=True)
+    env.reset(seed=seed)
+
+    expected = []
+    window = env.rules.log_observation_spaces['log_length'].n - 1
+
+    # the first 30 proposals are all rejected, so the log has to grow
+    while env.phase != 'game_over':
+        phase, current_round, leader = env.phase, env.current_round, env.leader
+        action = _random_action(env, rng, reject=len(expected) < 30)
+
+        observation, _, _, _, _ = env.step(action)
+
+        if phase == 'proposal':
+            expected.append({'round': current_round, 'leader': leader, 'team': env.proposed_team.copy(),
+                             'votes': np.zeros(env.num_players), 'fails': -1})
+        elif phase == 'voting':
+            expected[-1]['votes'] = action
+        elif phase == 'mission':
+            expected[-1]['fails'] = np.sum(action)
+
+        # the observation holds the latest proposals, up to the window
+        length = min(len(expected), window)
+        assert observation['log_length'] == length
+
+        for name in env.game_log.columns:
+            assert np.array_equal(observation['log_' + name][:length], [row[name] for row in expected[-length:]])
+
+    rows = env.game_log.rows()
+
+    assert len(env.game_log) == len(expected) > 30
+    for name in env.game_log.columns:
+        assert np.array_equal(rows[name], [row[name] for row in expected])
+
+    observation, _ = env.reset(seed=seed)
+    assert len(env.game_log) == 0 and observation['log_length'] == 0
+
+    # the rows of the game before are not left in the window
+    assert not observation['log_team'].any() and (observation['log_fails'] == -1).all()
+
+
+def test_restored_window_matches(seed=0):
+
+    rng = np.random.default_rng(seed)
+    env = AvalonEnv(render_mode=None, game_log=True, copy_obs=False)
+    env.reset(seed=seed)
+
+    # a snapshot from past the window, and one from before it
+    while len(env.game_log) < 30:
+        env.step(_random_action(env, rng, reject=True))
+    late = env.clone_state()
+    late_packed = PackedState.from_env(env)
+    late_window = {name: np.copy(value) for name, value in env.observation.items() if name.startswith('log_')}
+
+    env.reset(seed=seed)
+    while len(env.game_log) < 3:
+        env.step(_random_action(env, rng, reject=True))
+    early = env.clone_state()
+    early_window = {name: np.copy(value) for name, value in env.observation.items() if name.startswith('log_')}
+
+    for restore, state, expected in ((env.restore_state, late, late_window),
+                                     (env.restore_state, early, early_window),
+                                     (lambda state: state.restore(env), late_packed, late_window)):
+        restore(state)
+        observation = env._get_observation()
+
+        for name, value in expected.items():
+            assert np.array_equal(observation[name], value)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ismcts_agent's search budgets and worker pool.
+
+@author: sggjone5
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+from ismcts_agent import ismcts_agent
+
+
+def _voter(**kwargs):
+    env = AvalonEnv(render_mode=None)
+    env.reset(seed=0)
+
+    # the first proposal is voted on
+    observation, _, _, _, _ = env.step(0)
+
+    return ismcts_agent(0, env.roles[0], observation, env.secret_info[0], rng=np.random.default_rng(0),
+                        **kwargs), observation
+
+
+@pytest.mark.parametrize('kwargs', [{'time_budget': 0.0}, {'iterations': 0}])
+def test_decides_without_a_finished_simulation(kwargs):
+
+    searcher, observation = _voter(**kwargs)
+
+    assert searcher.select_action_voting(observation) in (0, 1)
+
+
+@pytest.mark.parametrize('parallel', ['thread', 'process'])
+def test_workers_keep_to_the_time_budget(parallel, time_budget=0.05):
+
+    searcher, observation = _voter(iterations=10 ** 9, time_budget=time_budget, workers=2, parallel=parallel)
+
+    try:
+        # the first decision starts the pool, which is kept for the rest
+        searcher.select_action_voting(observation)
+        executor = searcher._executor
+
+        start = time.perf_counter()
+        for _ in range(5):
+            assert searcher.select_action_voting(observation) in (0, 1)
+        elapsed = (time.perf_counter() - start) / 5
+
+        assert searcher._executor is executor
+        assert elapsed < 2 * time_budget
+
+    finally:
+        searcher.close()
+
+    assert searcher._executor is None
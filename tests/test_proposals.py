@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the Discrete proposal actions of AvalonEnv.
+
+@author: sggjone5
+"""
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+
+
+def test_team_index_proposes_that_team():
+
+    env = AvalonEnv(render_mode=None)
+    env.reset(seed=0)
+
+    env.step(3)
+
+    assert np.array_equal(env.proposed_team, env.team_tables[0].teams[3])
+
+
+@pytest.mark.parametrize('index', [-1, 56, 1000])
+def test_team_index_out_of_range_is_rejected(index):
+
+    env = AvalonEnv(render_mode=None)
+    env.reset(seed=0)
+
+    with pytest.raises(ValueError):
+        env.step(index)
+
+    assert env.phase == 'proposal'
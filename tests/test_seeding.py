@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that games are replayed exactly from their seeds.
+
+@author: sggjone5
+"""
+
+import numpy as np
+
+from avalon_env import AvalonEnv
+import main
+
+
+def test_spawn_seeds_leaves_parent_unchanged():
+
+    seed = np.random.SeedSequence(1234)
+
+    first = [s.generate_state(4) for s in main.spawn_seeds(seed, 3)]
+    second = [s.generate_state(4) for s in main.spawn_seeds(seed, 3)]
+
+    assert seed.n_children_spawned == 0
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+
+    # and the children are the same as those spawned from an int seed
+    from_int = [s.generate_state(4) for s in main.spawn_seeds(1234, 3)]
+    assert all(np.array_equal(a, b) for a, b in zip(first, from_int))
+
+
+def test_play_game_replays_from_seed_sequence():
+
+    env = AvalonEnv(render_mode=None, copy_obs=False)
+
+    for seed in main.spawn_seeds(7, 20):
+
+        first = main.play_game(env, seed)
+        second = main.play_game(env, seed)
+
+        assert first[0] == second[0]
+        assert first[1] == second[1]
+        assert np.array_equal(first[2], second[2])
+        assert first[3] == second[3]
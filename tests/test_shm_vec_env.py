@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ShmVecEnv against AvalonEnvs stepped in this process.
+
+@author: sggjone5
+"""
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+from agents import random_policy
+from shm_vec_env import ShmVecEnv
+import main
+
+
+@pytest.mark.parametrize('num_players, num_workers', [(5, 1), (8, 3)])
+def test_matches_sequential_envs(num_players, num_workers, num_envs=6, seed=7):
+
+    envs = [AvalonEnv(num_players=num_players, render_mode=None, obs_mode='flat') for _ in range(num_envs)]
+    policy = random_policy(num_players, np.random.default_rng(0))
+
+    with ShmVecEnv(num_envs, num_workers, num_players=num_players, seed=seed) as vec_env:
+
+        for env, env_seed in zip(envs, main.spawn_seeds(seed, num_envs)):
+            env.reset(seed=int(env_seed.generate_state(1)[0]))
+
+        for _ in range(300):
+            actions = policy.act(vec_env.seat_observations['phase'], vec_env.seat_observations)
+            observation, rewards, terminated, _, info = vec_env.step(actions)
+
+            for e, env in enumerate(envs):
+                expected, env_rewards, _, _, _ = env.step(actions[e])
+
+                if env.phase == 'game_over':
+                    assert terminated[e]
+                    assert np.array_equal(rewards[e], list(env_rewards.values()))
+                    assert info['evil_win'][e] == (main.get_win_condition(env) != main.GOOD_WIN)
+                    expected, _ = env.reset()
+                else:
+                    assert not terminated[e] and not rewards[e].any()
+
+                assert np.array_equal(observation[e], expected)
+
+
+def test_reports_every_failed_worker_once():
+
+    with ShmVecEnv(4, 2, seed=0) as vec_env:
+
+        # every proposal is of the wrong size, so both workers fail
+        with pytest.raises(RuntimeError) as error:
+            vec_env.step(np.ones((4, 8), dtype=np.int8))
+
+        assert str(error.value).count('Traceback') == 2
+
+        vec_env.reset(seed=0)
+
+        # the next failure only reports itself, not the errors before it
+        with pytest.raises(RuntimeError) as error:
+            vec_env.step(np.ones((4, 8), dtype=np.int8))
+
+        assert str(error.value).count('Traceback') == 2
+
+        vec_env.reset(seed=0)
+        policy = random_policy(8, np.random.default_rng(0))
+        vec_env.step(policy.act(vec_env.seat_observations['phase'], vec_env.seat_observations))
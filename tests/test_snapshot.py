@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that a clone_state / restore_state round trip is equivalent to the
+game it was taken from.
+
+@author: sggjone5
+"""
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+from agents import random_policy
+from packed_state import PackedState
+
+
+def _seat_observations(env):
+    return {
+        'leader': np.array([env.leader]),
+        'mission_size': np.array([env.mission_sizes[env.current_round]]),
+        'proposed_team': env.proposed_team[None],
+        'role': env.roles[None],
+    }
+
+
+@pytest.mark.parametrize('num_players', [5, 8, 10])
+def test_restored_snapshot_replays_identically(num_players, num_games=100, seed=0):
+    """
+    At a random step of every game the state is cloned and the rest of the
+    game is played, recording the packed state, observation and rewards of
+    every step. The snapshot is then restored into a fresh env which had been
+    playing a different game, and the same actions must reproduce them bit
+    for bit.
+    """
+    rng = np.random.default_rng(seed)
+    policy = random_policy(num_players, rng)
+
+    env = AvalonEnv(num_players=num_players, obs_mode='flat')
+    other = AvalonEnv(num_players=num_players, obs_mode='flat')
+
+    for game in range(num_games):
+
+        env.reset(seed=game)
+        other.reset(seed=num_games + game)
+
+        # play up to a random point in the game
+        for _ in range(rng.integers(0, 20)):
+            if env.phase == 'game_over':
+                break
+            env.step(policy.act(env.phase_to_int(env.phase), _seat_observations(env))[0])
+
+        snapshot = env.clone_state()
+
+        actions = []
+        expected = []
+        while not env.dones:
+            action = policy.act(env.phase_to_int(env.phase), _seat_observations(env))[0]
+            observation, rewards, dones, _, _ = env.step(action)
+
+            actions.append(action)
+            expected.append((PackedState.from_env(env), observation, rewards, dones))
+
+        other.restore_state(snapshot)
+
+        for step, (action, (state, observation, rewards, dones)) in enumerate(zip(actions, expected)):
+            replayed = other.step(action)
+
+            assert PackedState.from_env(other) == state, (game, step)
+            assert np.array_equal(replayed[0], observation), (game, step)
+            assert replayed[1] == rewards and replayed[2] == dones, (game, step)
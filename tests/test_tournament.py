@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the policy tournament.
+
+@author: sggjone5
+"""
+
+import math
+
+import pytest
+
+import parameters
+from agents import agent
+import tournament
+
+
+class saboteur(agent):
+    """
+    The random agent, except evil always fails missions.
+    """
+
+    def select_action_mission(self, observation):
+        return int(parameters.is_evil[self.role])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_custom_policies_are_played_and_decided(workers):
+
+    results = tournament.run_tournament({'random': agent, 'saboteur': saboteur}, workers=workers, seed=0,
+                                        batch_pairs=16, max_games=2000, margin=0.05)
+
+    pairing = results['pairings']['random', 'saboteur']
+
+    assert pairing['decision'] == 'saboteur'
+    assert pairing['games'] < 2000
+    assert results['ratings']['saboteur'] > results['ratings']['random']
+
+
+def test_pairing_without_games_has_nan_win_rate():
+
+    results = tournament.run_tournament({'a': agent, 'b': agent}, max_games=0)
+
+    pairing = results['pairings']['a', 'b']
+
+    assert pairing['games'] == 0
+    assert math.isnan(pairing['win_rate'])
+
+
+def test_results_do_not_depend_on_the_workers():
+
+    results = [tournament.run_tournament({'random': agent, 'saboteur': saboteur}, workers=workers, seed=3,
+                                         batch_pairs=5, max_games=40, margin=0.01)
+               for workers in (1, 2, 3)]
+
+    for other in results[1:]:
+        assert other['pairings'] == results[0]['pairings']
+        assert other['win_rate_by_role'] == results[0]['win_rate_by_role']
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of recording games with TrajectoryWriter and reading them back.
+
+@author: sggjone5
+"""
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+from trajectory import TrajectoryWriter, TrajectoryReader
+import main
+
+
+player_counts = [5, 6, 7, 8, 9, 10]
+
+
+@pytest.mark.parametrize('num_players', player_counts)
+def test_record_dict_observations(tmp_path, num_players):
+
+    env = AvalonEnv(num_players=num_players, render_mode=None, copy_obs=False)
+
+    with TrajectoryWriter(tmp_path, num_players=num_players, chunk_size=64) as writer:
+        results = [main.play_game(env, seed, writer=writer) for seed in range(10)]
+
+    reader = TrajectoryReader(tmp_path)
+
+    assert reader.num_games == 10
+
+    for game, (_, _, roles, _) in enumerate(results):
+        steps = reader.game(game)
+
+        assert np.array_equal(steps['roles'], roles)
+        assert steps['done'][-1] and not steps['done'][:-1].any()
+
+
+@pytest.mark.parametrize('num_players', player_counts)
+def test_record_flat_observations(tmp_path, num_players):
+
+    # the agents play from the dict env, and a flat env dealt the same game
+    # is stepped alongside it, its observations recorded as they are
+    env = AvalonEnv(num_players=num_players, render_mode=None, copy_obs=False)
+    flat_env = AvalonEnv(num_players=num_players, render_mode=None, obs_mode='flat')
+
+    observation, _ = env.reset(seed=3)
+    flat_observation, _ = flat_env.reset(seed=3)
+    players = [main.agent(i, env.roles[i], observation, env.secret_info[i]) for i in env.agents]
+
+    recorded = []
+    with TrajectoryWriter(tmp_path, num_players=num_players) as writer:
+        writer.begin_game(flat_env)
+
+        while env.phase != 'game_over':
+            action = main.select_action(env, players, observation)
+
+            writer.append(flat_observation, action, env.phase_to_int(env.phase))
+            recorded.append(flat_observation)
+
+            observation, rewards, _, _, _ = env.step(action)
+            flat_observation, _, _, _, _ = flat_env.step(action)
+            writer.outcome(rewards, env.phase == 'game_over')
+
+    reader = TrajectoryReader(tmp_path)
+
+    assert np.array_equal(reader.columns['obs'], np.array(recorded))
+
+
+def test_record_discussion_games(tmp_path):
+
+    env = AvalonEnv(render_mode=None, copy_obs=False, discussion=True)
+    flat_env = AvalonEnv(render_mode=None, obs_mode='flat', discussion=True)
+
+    with TrajectoryWriter(tmp_path, discussion=True) as writer:
+        main.play_game(env, 0, writer=writer)
+
+    reader = TrajectoryReader(tmp_path)
+    discussion = reader.columns['phase'] == AvalonEnv.phase_dict['discussion']
+
+    assert discussion.any()
+    assert reader.columns['obs'].shape[1] == flat_env.observation_space.shape[0]
+    assert reader.columns['message'].shape == (reader.num_steps, 8, 8)
+    assert not reader.columns['action'][discussion].any()
+
+    # the phase is encoded in its own slot
+    phases = reader.columns["obs"][:, flat_env.obs_layout.slices["phase"]].argmax(axis=1)
+    assert np.array_equal(phases, reader.columns['phase'])
+
+
+def test_discussion_step_needs_discussion_writer(tmp_path):
+
+    env = AvalonEnv(render_mode=None, copy_obs=False, discussion=True)
+
+    with TrajectoryWriter(tmp_path) as writer:
+        with pytest.raises(ValueError):
+            main.play_game(env, 0, writer=writer)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that VecAvalonEnv plays by the same rules as AvalonEnv.step.
+
+@author: sggjone5
+"""
+
+import numpy as np
+import pytest
+
+from avalon_env import AvalonEnv
+from vec_avalon_env import VecAvalonEnv
+from agents import random_policy
+
+
+@pytest.mark.parametrize('num_players', [5, 6, 7, 8, 9, 10])
+def test_matches_avalon_env(num_players, num_envs=16, num_steps=1000, seed=0):
+    """
+    Every game of the VecAvalonEnv is mirrored by an AvalonEnv dealt the
+    same roles, and both are stepped with the same actions.
+    """
+    vec_env = VecAvalonEnv(num_envs=num_envs, num_players=num_players, seed=seed)
+    policy = random_policy(num_players, np.random.default_rng(seed))
+
+    envs = [AvalonEnv(num_players=num_players, render_mode=None) for _ in range(num_envs)]
+    for e, env in enumerate(envs):
+        env.reset()
+        env.set_roles(vec_env.roles[e])
+
+    games = 0
+
+    for _ in range(num_steps):
+        actions = policy.act(vec_env.phase, vec_env.seat_observations)
+        _, rewards, terminated, _, info = vec_env.step(actions)
+
+        # every info entry covers every game
+        for value in info.values():
+            assert len(value) == num_envs
+
+        for e, env in enumerate(envs):
+            env.step(actions[e])
+
+            if env.phase == 'game_over':
+                assert terminated[e]
+                assert np.array_equal(rewards[e], [env.rewards[name] for name in env.agent_names])
+                assert info['evil_win'][e] == (env.assassin_kill or env.failed_missions >= 3)
+                assert info['assassin_kill'][e] == env.assassin_kill
+                assert np.array_equal(info['roles'][e], env.roles)
+                assert info['missions'][e] == env.successful_missions + env.failed_missions
+
+                games += 1
+                env.reset()
+                env.set_roles(vec_env.roles[e])
+
+            else:
+                assert not terminated[e] and not rewards[e].any()
+                assert vec_env.phase[e] == env.phase_dict[env.phase]
+                assert vec_env.current_round[e] == env.current_round
+                assert vec_env.leader[e] == env.leader
+                assert vec_env.successful_missions[e] == env.successful_missions
+                assert vec_env.failed_missions[e] == env.failed_missions
+                assert np.array_equal(vec_env.proposed_team[e], env.proposed_team)
+
+    assert games > 0
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+A tournament between Avalon policies, with ratings and early stopping.
+
+A policy is anything constructed like agents.agent, taking (agent_idx,
+role, observation, secret_role_knowledge, rng) and providing the
+select_action_* methods, such as agents.agent itself or a functools.partial
+of ismcts_agent, and run_tournament takes a mapping of names to policies.
+With more than one worker they are pickled, so they must be importable
+classes or functions, or partials of them.
+
+In a pairing one policy controls every good seat and the other every evil
+seat. Games are played in pairs from the same seed, so the same roles are
+dealt, with the policies swapping sides between the two, so neither gains
+from the side it happens to play.
+
+Each pairing is played in batches, split over a pool of worker processes,
+and after every batch a sequential probability ratio test (SPRT) on the
+first policy's win rate decides between
+
+    H0: p = 0.5 - margin, the second policy is stronger
+    H1: p = 0.5 + margin, the first policy is stronger
+
+stopping the pairing as soon as the log likelihood ratio crosses either
+bound, or at max_games. A clearly mismatched pairing is decided in a few
+dozen games, and only close ones need many.
+
+Ratings are fitted to every game played with the Bradley-Terry model, on
+the Elo scale with a mean of 1500, along with each policy's win rate in
+each role. For example
+
+    python tournament.py --policies random ismcts --workers 4
+
+@author: sggjone5
+"""
+
+import argparse
+import itertools
+import math
+import multiprocessing
+from functools import partial
+
+import numpy as np
+
+import parameters
+from avalon_env import AvalonEnv
+from agents import agent
+from ismcts_agent import ismcts_agent
+import main
+
+
+# the policies available from the command line
+default_policies = {
+    'random': agent,
+    'ismcts': partial(ismcts_agent, iterations=100),
+}
+
+
+def play_match(env, good_policy, evil_policy, seed):
+    """
+    Play one game with good_policy in every good seat and evil_policy in
+    every evil seat, returning whether evil won and the win condition.
+    """
+    env_seed, agents_seed = main.spawn_seeds(seed, 2)
+    agents_rng = np.random.default_rng(agents_seed)
+
+    observation, _ = env.reset(seed=int(env_seed.generate_state(1)[0]))
+
+    player_models = [(evil_policy if env.evil_mask[i] else good_policy)(
+        env.agents[i], env.roles[i], observation, env.secret_info[i], rng=agents_rng) for i in env.agents]
+
+    while env.dones == False:
+
+        action = main.select_action(env, player_models, observation)
+
+        observation, reward, terminated, truncated, info = env.step(action)
+
+    win_condition = main.get_win_condition(env)
+
+    return win_condition != main.GOOD_WIN, win_condition
+
+
+def play_batch(policy_a, policy_b, pair_seeds, num_players=8):
+    """
+    Play a pair of games between two policies in one worker for every seed
+    of pair_seeds, each pair dealt from its seed with the policies swapping
+    sides.
+
+    Returns, for every game, whether policy_a won, whether it played good,
+    and the roles.
+    """
+    env = AvalonEnv(num_players=num_players, render_mode=None, copy_obs=False)
+    num_pairs = len(pair_seeds)
+
+    a_won = np.zeros(2 * num_pairs, dtype=bool)
+    a_good = np.zeros(2 * num_pairs, dtype=bool)
+    roles = np.zeros((2 * num_pairs, num_players), dtype=np.int8)
+
+    for pair, pair_seed in enumerate(pair_seeds):
+        for side, (good_policy, evil_policy) in enumerate([(policy_a, policy_b), (policy_b, policy_a)]):
+
+            game = 2 * pair + side
+            evil_win, _ = play_match(env, good_policy, evil_policy, pair_seed)
+
+            a_good[game] = side == 0
+            a_won[game] = evil_win != a_good[game]
+            roles[game] = env.roles
+
+    return a_won, a_good, roles
+
+
+def _play_batch(args):
+    return play_batch(*args)
+
+
+def sprt_bounds(alpha, beta):
+    """
+    The lower and upper log likelihood ratio bounds of the SPRT, for
+    accepting H0 and H1.
+    """
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def sprt_llr(wins, losses, margin):
+    """
+    The log likelihood ratio of H1: p = 0.5 + margin against H0: p = 0.5 -
+    margin, after wins and losses.
+    """
+    p0 = 0.5 - margin
+    p1 = 0.5 + margin
+
+    return wins * math.log(p1 / p0) + losses * math.log((1 - p1) / (1 - p0))
+
+
+def bradley_terry(names, wins, iterations=200):
+    """
+    Fit Bradley-Terry strengths to wins[i, j], the games policy i won
+    against policy j, returned as Elo ratings with a mean of 1500.
+    """
+    num_policies = len(names)
+    games = wins + wins.T
+
+    # a draw's worth of prior games keeps unbeaten policies finite
+    wins = wins + 0.5 * (games > 0)
+    games = wins + wins.T
+
+    strength = np.ones(num_policies)
+
+    # the minorization-maximization updates of Hunter (2004)
+    for _ in range(iterations):
+        pair_strength = strength[:, None] + strength[None, :]
+        denominator = (games / pair_strength).sum(axis=1)
+
+        strength = np.where(denominator > 0, wins.sum(axis=1) / np.maximum(denominator, 1e-12), strength)
+        strength /= np.exp(np.log(strength).mean())
+
+    elo = 400 * np.log10(strength)
+
+    return {name: float(1500 + rating - elo.mean()) for name, rating in zip(names, elo)}
+
+
+def run_tournament(policies, workers=1, seed=None, batch_pairs=16, max_games=2000, margin=0.05,
+                   alpha=0.05, beta=0.05, num_players=8, on_batch=None):
+    """
+    Play every pairing of policies, a mapping of names to policies, until
+    its SPRT is decided or max_games have been played. Each round plays one
+    batch of batch_pairs pairs of games for every undecided pairing, split
+    over the workers.
+
+    Returns the result of every pairing, the ratings and every policy's win
+    rate in each role. A pairing which played no games has a win rate of
+    nan.
+    """
+    if batch_pairs < 1:
+        raise ValueError('Every batch must play at least one pair of games.')
+
+    policies = dict(policies)
+    names = list(policies)
+    index = {name: i for i, name in enumerate(names)}
+
+    lower, upper = sprt_bounds(alpha, beta)
+
+    pairings = {}
+    for (name_a, name_b), pairing_seed in zip(itertools.combinations(names, 2),
+                                              main.spawn_seeds(seed, len(names) * (len(names) - 1) // 2)):
+        pairings[name_a, name_b] = {'games': 0, 'wins': 0, 'llr': 0.0, 'decision': None,
+                                    'seed': pairing_seed}
+
+    wins = np.zeros((len(names), len(names)))
+    role_games = np.zeros((len(names), parameters.num_role_codes), dtype=np.int64)
+    role_wins = np.zeros((len(names), parameters.num_role_codes), dtype=np.int64)
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+
+    try:
+        while True:
+
+            active = [key for key, pairing in pairings.items()
+                      if pairing['decision'] is None and pairing['games'] < max_games]
+
+            if not active:
+                break
+
+            # every active pairing's batch is split into one task per worker.
+            # Each pair has its own seed, the next ones of the pairing, so
+            # the games played do not depend on the number of workers
+            tasks = []
+            owners = []
+            for key in active:
+                pairing = pairings[key]
+                pairs = min(batch_pairs, (max_games - pairing['games'] + 1) // 2)
+                pair_seeds = main.spawn_seeds(pairing['seed'], pairs, start=pairing['games'] // 2)
+
+                for split in np.array_split(np.arange(pairs), workers):
+                    if len(split):
+                        tasks.append((policies[key[0]], policies[key[1]], pair_seeds[split[0]:split[-1] + 1],
+                                      num_players))
+                        owners.append(key)
+
+            results = pool.map(_play_batch, tasks) if pool is not None else map(_play_batch, tasks)
+
+            for key, (a_won, a_good, roles) in zip(owners, results):
+
+                pairing = pairings[key]
+                a, b = index[key[0]], index[key[1]]
+
+                pairing['games'] += len(a_won)
+                pairing['wins'] += int(a_won.sum())
+
+                wins[a, b] += a_won.sum()
+                wins[b, a] += (~a_won).sum()
+
+                # every seat is played by policy a if it is on a's side
+                evil = parameters.is_evil[roles]
+                a_seat = evil != a_good[:, None]
+                seat_won = a_seat == a_won[:, None]
+
+                for policy, seats in ((a, a_seat), (b, ~a_seat)):
+                    role_games[policy] += np.bincount(roles[seats], minlength=parameters.num_role_codes)
+                    role_wins[policy] += np.bincount(roles[seats & seat_won], minlength=parameters.num_role_codes)
+
+            for key in active:
+                pairing = pairings[key]
+                pairing['llr'] = sprt_llr(pairing['wins'], pairing['games'] - pairing['wins'], margin)
+
+                if pairing['llr'] >= upper:
+                    pairing['decision'] = key[0]
+                elif pairing['llr'] <= lower:
+                    pairing['decision'] = key[1]
+
+                if on_batch is not None:
+                    on_batch(key, pairing)
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    for pairing in pairings.values():
+        del pairing['seed']
+        pairing['win_rate'] = pairing['wins'] / pairing['games'] if pairing['games'] else float('nan')
+
+    return {
+        'pairings': pairings,
+        'ratings': bradley_terry(names, wins),
+        'win_rate_by_role': {
+            name: {role: float(role_wins[i, code] / role_games[i, code])
+                   for code, role in enumerate(parameters.role_names) if role_games[i, code] > 0}
+            for i, name in enumerate(names)
+        },
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Play a tournament between Avalon policies.')
+    parser.add_argument('--policies', nargs='+', default=list(default_policies), choices=list(default_policies))
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-pairs', type=int, default=16, help='pairs of games per pairing per round')
+    parser.add_argument('--max-games', type=int, default=2000, help='most games played by one pairing')
+    parser.add_argument('--margin', type=float, default=0.05, help='win rate margin from 0.5 of the SPRT')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--players', type=int, default=8, help='number of players, 5 to 10')
+    args = parser.parse_args()
+
+    def report(key, pairing):
+        win_rate = pairing['wins'] / pairing['games'] if pairing['games'] else float('nan')
+        print(f"{key[0]} vs {key[1]}: {pairing['games']} games, win rate {win_rate:.3f}, "
+              f"LLR {pairing['llr']:.2f}" + (f", {pairing['decision']} is stronger" if pairing['decision'] else ''))
+
+    results = run_tournament({name: default_policies[name] for name in args.policies}, workers=args.workers,
+                             seed=args.seed, batch_pairs=args.batch_pairs,
+                             max_games=args.max_games, margin=args.margin, alpha=args.alpha, beta=args.beta,
+                             num_players=args.players, on_batch=report)
+
+    print('Ratings:')
+    for name, rating in sorted(results['ratings'].items(), key=lambda item: -item[1]):
+        print(f'  {name}: {rating:.0f}')
+
+    print('Win rate by role:')
+    for name, rates in results['win_rate_by_role'].items():
+        print(f'  {name}: ' + ', '.join(f'{role} {rate:.3f}' for role, rate in rates.items()))
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+A columnar, memory mapped store of game trajectories for offline learning.
+
+TrajectoryWriter appends every step of every game into preallocated chunk
+buffers, one per column, and writes a chunk out to the end of the column's
+raw .bin file whenever it fills up, so memory use is bounded by the chunk
+size however many steps are recorded. The columns of a step are
+
+    obs       - (obs_size,) the flat observation the action was taken from,
+                laid out by obs_encoding.ObsLayout and stored as uint8
+    action    - (num_players,) the collated action passed to env.step
+    reward    - (num_players,) the rewards returned by env.step
+    phase     - the phase integer the action was taken in
+    done      - whether the game ended on the step
+
+With discussion=True, for a dataset of games with a discussion phase, the
+layout includes the message board and the step columns gain
+
+    message   - (num_players, max_msg_len) the messages posted on a
+                discussion step, all 0 on any other step
+
+whose action is all 0 instead. Token ids are stored as uint8 in obs, so
+the vocabulary can hold at most 256 tokens.
+
+Each game adds its first step index and roles to the game index columns
+game_start and game_roles. The dtypes, shapes and lengths of every column
+are kept in meta.json, which is rewritten on every flush, so a dataset can
+be read while it is still being written.
+
+TrajectoryReader np.memmaps the columns, so any game or a random minibatch
+of transitions can be read without loading the whole dataset.
+
+    writer = TrajectoryWriter('games')
+    writer.begin_game(env)
+    ...
+    writer.append(observation, action, phase)
+    observation, rewards, ... = env.step(action)
+    writer.outcome(rewards, env.phase == 'game_over')
+    ...
+    writer.close()
+
+    reader = TrajectoryReader('games')
+    batch = reader.sample(256, rng)
+
+@author: sggjone5
+"""
+
+import json
+import os
+
+import numpy as np
+
+import rules
+from avalon_env import AvalonEnv
+from obs_encoding import get_layout
+
+
+meta_file = 'meta.json'
+
+
+class TrajectoryWriter():
+    """
+    Streams steps into chunked columnar files in a directory.
+    """
+
+    def __init__(self, path, num_players=8, chunk_size=65536, append=False, discussion=False, max_msg_len=8,
+                 message_history=8, vocab_size=32):
+
+        self.path = path
+        self.chunk_size = chunk_size
+        self.num_players = num_players
+        self.discussion = discussion
+
+        if discussion and vocab_size > 256:
+            raise ValueError('Tokens are stored as uint8, so the vocabulary can hold at most 256 tokens.')
+
+        # the same cached rules and layout as the flat observation of an env
+        # with these arguments, so flat observations can be stored as they are
+        game_rules = rules.get_rules(num_players)
+        num_phases = len(AvalonEnv.phase_dict) if discussion else len(AvalonEnv.phase_dict) - 1
+        self.obs_layout = get_layout(num_players, game_rules.num_rounds, game_rules.max_mission_size, num_phases,
+                                     max_msg_len if discussion else 0, message_history, vocab_size)
+
+        # the dtype and per step shape of every column
+        self.step_columns = {
+            'obs': (np.uint8, (self.obs_layout.size,)),
+            'action': (np.int8, (num_players,)),
+            'reward': (np.float32, (num_players,)),
+            'phase': (np.int8, ()),
+            'done': (np.bool_, ()),
+        }
+        if discussion:
+            self.step_columns['message'] = (np.uint8, (num_players, max_msg_len))
+        self.game_columns = {
+            'game_start': (np.int64, ()),
+            'game_roles': (np.int8, (num_players,)),
+        }
+
+        # preallocated chunk buffers, written out when full
+        self.buffers = {name: np.zeros((chunk_size,) + shape, dtype=dtype)
+                        for name, (dtype, shape) in {**self.step_columns, **self.game_columns}.items()}
+
+        self.num_steps = 0
+        self.num_games = 0
+        self.step_pos = 0 # steps in the buffers, not yet written
+        self.game_pos = 0
+
+        os.makedirs(path, exist_ok=True)
+
+        if append and os.path.exists(os.path.join(path, meta_file)):
+            with open(os.path.join(path, meta_file)) as f:
+                meta = json.load(f)
+
+            if (meta['num_players'] != num_players or meta['obs_size'] != self.obs_layout.size
+                    or meta.get('discussion', False) != discussion):
+                raise ValueError(f'{path} holds a dataset with a different layout.')
+
+            self.num_steps = meta['num_steps']
+            self.num_games = meta['num_games']
+            mode = 'ab'
+
+        else:
+            mode = 'wb'
+
+        self.files = {name: open(os.path.join(path, name + '.bin'), mode) for name in self.buffers}
+
+        self._write_meta()
+
+
+    def begin_game(self, env):
+        """
+        Start a new game, called after env.reset.
+        """
+        if self.game_pos == self.chunk_size:
+            self.flush()
+
+        self.buffers['game_start'][self.game_pos] = self.num_steps + self.step_pos
+        self.buffers['game_roles'][self.game_pos] = env.roles
+        self.game_pos += 1
+
+
+    def append(self, observation, action, phase):
+        """
+        Record the start of one step, observation being the dict or flat
+        observation the action was taken from. The reward and done of the
+        step are filled in by outcome once env.step has returned, so the
+        observation can be a view the env will overwrite.
+        """
+        discussion = phase == AvalonEnv.phase_dict['discussion']
+
+        # a discussion step would be encoded into the wrong phase slot
+        if discussion and not self.discussion:
+            raise ValueError('A discussion step can only be recorded with discussion=True.')
+
+        if self.step_pos == self.chunk_size:
+            self.flush()
+
+        pos = self.step_pos
+        buffers = self.buffers
+
+        if isinstance(observation, dict):
+            self.obs_layout.encode(observation, out=buffers['obs'][pos])
+        else:
+            buffers['obs'][pos] = observation
+
+        # the messages of a discussion step go in their own column
+        if discussion:
+            buffers['message'][pos] = action
+            buffers['action'][pos] = 0
+        else:
+            buffers['action'][pos] = action
+            if self.discussion:
+                buffers['message'][pos] = 0
+
+        buffers['phase'][pos] = phase
+        buffers['reward'][pos] = 0
+        buffers['done'][pos] = False
+
+        self.step_pos += 1
+
+
+    def outcome(self, rewards, done):
+        """
+        Record the rewards dict returned by env.step, empty until the game is
+        over, and whether the game ended, for the last appended step.
+        """
+        pos = self.step_pos - 1
+
+        if rewards:
+            self.buffers['reward'][pos] = list(rewards.values())
+
+        self.buffers['done'][pos] = done
+
+
+    def flush(self):
+        """
+        Write the buffered steps and games to the end of the column files.
+        """
+        for name in self.step_columns:
+            self.buffers[name][:self.step_pos].tofile(self.files[name])
+
+        for name in self.game_columns:
+            self.buffers[name][:self.game_pos].tofile(self.files[name])
+
+        for f in self.files.values():
+            f.flush()
+
+        self.num_steps += self.step_pos
+        self.num_games += self.game_pos
+        self.step_pos = 0
+        self.game_pos = 0
+
+        self._write_meta()
+
+
+    def _write_meta(self):
+
+        columns = {name: {'dtype': np.dtype(dtype).str, 'shape': list(shape)}
+                   for name, (dtype, shape) in {**self.step_columns, **self.game_columns}.items()}
+
+        meta = {
+            'num_steps': self.num_steps,
+            'num_games': self.num_games,
+            'num_players': self.num_players,
+            'obs_size': self.obs_layout.size,
+            'discussion': self.discussion,
+            'columns': columns,
+        }
+
+        # written to a temporary file first so readers never see half of it
+        temp = os.path.join(self.path, meta_file + '.tmp')
+        with open(temp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(temp, os.path.join(self.path, meta_file))
+
+
+    def close(self):
+        """
+        Flush any buffered steps and close the column files.
+        """
+        if self.files is None:
+            return
+
+        self.flush()
+
+        for f in self.files.values():
+            f.close()
+        self.files = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader():
+    """
+    Memory mapped, read only access to a dataset written by TrajectoryWriter.
+    """
+
+    def __init__(self, path):
+
+        with open(os.path.join(path, meta_file)) as f:
+            self.meta = json.load(f)
+
+        self.num_steps = self.meta['num_steps']
+        self.num_games = self.meta['num_games']
+        self.num_players = self.meta['num_players']
+
+        self.columns = {}
+        for name, column in self.meta['columns'].items():
+            length = self.num_games if name.startswith('game_') else self.num_steps
+            shape = (length,) + tuple(column['shape'])
+
+            # np.memmap cannot map an empty file
+            if length == 0:
+                self.columns[name] = np.zeros(shape, dtype=column['dtype'])
+            else:
+                self.columns[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=column['dtype'],
+                                               mode='r', shape=shape)
+
+        # the end of each game is the start of the next
+        self.game_end = np.append(self.columns['game_start'][1:], self.num_steps)
+
+
+    def __len__(self):
+        return self.num_steps
+
+
+    def game(self, game_idx):
+        """
+        Every step of one game, as views into the mapped columns, along with
+        the roles of the game.
+        """
+        start = self.columns['game_start'][game_idx]
+        end = self.game_end[game_idx]
+
+        steps = {name: column[start:end] for name, column in self.columns.items()
+                 if not name.startswith('game_')}
+        steps['roles'] = self.columns['game_roles'][game_idx]
+
+        return steps
+
+
+    def sample(self, batch_size, rng=None):
+        """
+        A random minibatch of transitions, with next_obs the observation
+        after each step, or the same observation on the last step of a game.
+        Only the sampled rows are read from disk.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+
+        # sorted indexes read the files in order
+        idx = np.sort(rng.integers(0, self.num_steps, batch_size))
+
+        batch = {name: column[idx] for name, column in self.columns.items()
+                 if not name.startswith('game_')}
+
+        next_idx = np.where(batch['done'], idx, np.minimum(idx + 1, self.num_steps - 1))
+        batch['next_obs'] = self.columns['obs'][next_idx]
+
+        # the game each step belongs to, and its roles
+        games = np.searchsorted(self.columns['game_start'], idx, side='right') - 1
+        batch['roles'] = self.columns['game_roles'][games]
+
+        return batch
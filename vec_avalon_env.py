@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+A batched version of the Avalon environment, where many games are played at
+once and the game state of every game is held as (num_envs, ...) NumPy arrays.
+
+The rules are identical to AvalonEnv.step, but rather than branching on a
+phase string for a single game, each step builds a boolean mask per phase and
+applies that phase's logic to every game in it at the same time. Actions
+come in as (num_envs, num_players), one collated action per game, exactly
+as they would be passed to AvalonEnv.step:
+
+    - proposal
+        binary vector of the proposed team
+    - voting
+        binary vector of every player's vote, 1 accept
+    - mission
+        binary vector of the mission actions, 1 fail
+    - assassination
+        one hot vector of the assassination target, all zeros does nothing
+
+With discussion=True a discussion phase is played after every proposal,
+as in AvalonEnv. Its messages, (num_envs, num_players, max_msg_len) tokens,
+are passed to step separately, and games without messages post the empty
+message.
+
+Games which finish are reset in place during the same step, so unlike
+AvalonEnv no extra step is needed in the 'game_over' phase. The terminal
+rewards are returned for that step and the next observation is from the new
+game.
+
+@author: sggjone5
+"""
+
+import numpy as np
+
+from gymnasium import spaces
+
+import parameters
+import rules
+
+
+# phase integers, matching AvalonEnv.phase_to_int
+PROPOSAL = 0
+VOTING = 1
+MISSION = 2
+ASSASSINATION = 3
+GAME_OVER = 4
+DISCUSSION = 5
+
+
+class VecAvalonEnv():
+    """
+    Plays num_envs games of Avalon at once as NumPy arrays.
+    """
+
+    def __init__(self, num_envs=1, num_players=8, seed=None, discussion=False, max_msg_len=8,
+                 message_history=8, vocab_size=32):
+        """
+        seed can be anything np.random.default_rng takes, including a
+        SeedSequence spawned for this env.
+        """
+
+        self.num_envs = num_envs
+        self.num_players = num_players
+        self.num_rounds = 5
+
+        self.discussion = discussion
+        self.max_msg_len = max_msg_len
+        self.message_history_len = message_history
+        self.vocab_size = vocab_size
+
+        # the rules of this player count, shared with every other env
+        self.rules = rules.get_rules(num_players)
+
+        # mission sizes for each round
+        self.mission_sizes = self.rules.mission_size_array
+
+        # fails needed to fail each round's mission, two on Mission 4 from 7 players
+        self.fails_required = self.rules.fails_required
+
+        self.rng = np.random.default_rng(seed)
+
+        # game state, every array is only ever updated in place
+        self.current_round = np.zeros(num_envs, dtype=np.int8)
+        self.leader = np.zeros(num_envs, dtype=np.int8)
+        self.phase = np.zeros(num_envs, dtype=np.int8)
+        self.successful_missions = np.zeros(num_envs, dtype=np.int8)
+        self.failed_missions = np.zeros(num_envs, dtype=np.int8)
+        self.mission_size = np.zeros(num_envs, dtype=np.int8)
+
+        self.proposed_team = np.zeros((num_envs, num_players), dtype=np.int8)
+        self.votes = np.zeros((num_envs, num_players), dtype=np.int8)
+        self.votes_history = np.zeros((num_envs, self.num_rounds, num_players), dtype=np.int8)
+        self.mission_history = np.zeros((num_envs, self.num_rounds), dtype=np.int8)
+
+        # roles as parameters role codes, with the lookups cached per game
+        self.roles = np.zeros((num_envs, num_players), dtype=np.int8)
+        self.evil_mask = np.zeros((num_envs, num_players), dtype=bool)
+        self.merlin_idx = np.zeros(num_envs, dtype=np.int8)
+        self.assassin_idx = np.zeros(num_envs, dtype=np.int8)
+        self.assassin_kill = np.zeros(num_envs, dtype=bool)
+
+        # secret_knowledge[e, i, j] is the one hot role of player j if
+        # player i knows it, see parameters.secret_knowledge
+        self.secret_knowledge = np.zeros((num_envs, num_players, num_players, parameters.num_role_codes), dtype=np.int8)
+
+        # the action and observation spaces of a single game
+        self.single_action_space = spaces.MultiBinary(num_players)
+        self.single_observation_space = spaces.Dict({'phase': spaces.Discrete(6 if discussion else 5),
+                                                     **self.rules.observation_spaces})
+
+        # the observation is built once, as read only views of the game state
+        self.observation = {
+            'phase': self.phase,
+            'current_round': self.current_round,
+            'leader': self.leader,
+            'proposed_team': self.proposed_team,
+            'votes': self.votes,
+            'votes_history': self.votes_history,
+            'mission_history': self.mission_history,
+            'successful_missions': self.successful_missions,
+            'failed_missions': self.failed_missions,
+            'num_players': np.full(num_envs, num_players, dtype=np.int8),
+            'mission_size': self.mission_size
+        }
+
+        # the message boards and their ring buffered histories
+        if discussion:
+            self.message_board = np.zeros((num_envs, num_players, max_msg_len), dtype=np.int32)
+            self.message_history = np.zeros((num_envs, message_history, num_players, max_msg_len), dtype=np.int32)
+            self.message_cursor = np.zeros(num_envs, dtype=np.int8)
+
+            self.observation['message_board'] = self.message_board
+            self.observation['message_history'] = self.message_history
+            self.observation['message_cursor'] = self.message_cursor
+
+            self.single_observation_space['message_board'] = spaces.Box(
+                low=0, high=vocab_size - 1, shape=(num_players, max_msg_len), dtype=np.int32)
+            self.single_observation_space['message_history'] = spaces.Box(
+                low=0, high=vocab_size - 1, shape=(message_history, num_players, max_msg_len), dtype=np.int32)
+            self.single_observation_space['message_cursor'] = spaces.Discrete(message_history)
+
+        for key, value in self.observation.items():
+            self.observation[key] = self._read_only(value)
+
+        # the observations of every seat for batched policies, the public
+        # observation along with each seat's own role and secret knowledge
+        self.seat_observations = dict(self.observation)
+        self.seat_observations['role'] = self._read_only(self.roles)
+        self.seat_observations['secret_knowledge'] = self._read_only(self.secret_knowledge)
+
+        self.reset()
+
+
+    @staticmethod
+    def _read_only(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+
+    def assign_roles(self, env_idxs):
+        """
+        Randomly assign roles to the players of the given games, with one
+        shuffle per game drawn at once.
+        """
+        roles = parameters.draw_roles(self.rng, len(env_idxs), self.rules.roles)
+        self.roles[env_idxs] = roles
+
+        self.evil_mask[env_idxs] = parameters.is_evil[roles]
+        self.merlin_idx[env_idxs] = np.argmax(roles == parameters.MERLIN, axis=1)
+        self.assassin_idx[env_idxs] = np.argmax(roles == parameters.ASSASSIN, axis=1)
+
+        self.secret_knowledge[env_idxs] = parameters.secret_knowledge(roles)
+
+
+    def reset_envs(self, env_idxs):
+        """
+        Reset the given games to the initial state.
+        """
+        self.current_round[env_idxs] = 0
+        self.leader[env_idxs] = 0
+        self.phase[env_idxs] = PROPOSAL
+        self.successful_missions[env_idxs] = 0
+        self.failed_missions[env_idxs] = 0
+        self.mission_size[env_idxs] = self.mission_sizes[0]
+
+        self.proposed_team[env_idxs] = 0
+        self.votes[env_idxs] = 0
+        self.votes_history[env_idxs] = 0
+        self.mission_history[env_idxs] = 0
+
+        if self.discussion:
+            self.message_board[env_idxs] = 0
+            self.message_history[env_idxs] = 0
+            self.message_cursor[env_idxs] = 0
+
+        self.assassin_kill[env_idxs] = False
+
+        self.assign_roles(env_idxs)
+
+
+    def reset(self, seed=None):
+        """
+        Reset every game to the initial state.
+        """
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+
+        self.reset_envs(np.arange(self.num_envs))
+
+        return self.observation, {}
+
+
+    def step(self, actions, messages=None):
+        """
+        Advance every game by one phase. messages are the posts of every
+        seat for the games in the discussion phase, if it is played.
+
+        Returns the observation, a (num_envs, num_players) array of rewards
+        which is only non zero for games that finished on this step, the
+        terminated and truncated flags and an info dict holding the outcome
+        of the finished games. Every info entry has a (num_envs, ...) axis,
+        and is only meaningful where terminated is True:
+
+            evil_win        - whether evil won
+            assassin_kill   - whether the Assassin found Merlin
+            roles           - (num_envs, num_players) role codes of the game
+            missions        - missions played
+        """
+        actions = np.asarray(actions, dtype=np.int8)
+        totals = actions.sum(axis=1)
+
+        # masks are taken before any game moves on, so each game only
+        # advances a single phase per step
+        proposal = self.phase == PROPOSAL
+        voting = self.phase == VOTING
+        mission = self.phase == MISSION
+        assassination = self.phase == ASSASSINATION
+        discussion = self.phase == DISCUSSION
+
+        evil_win = np.zeros(self.num_envs, dtype=bool)
+        good_win = np.zeros(self.num_envs, dtype=bool)
+
+        # proposal phase, the leader proposes a team of the mission size
+        if proposal.any():
+
+            if np.any(totals[proposal] != self.mission_size[proposal]):
+                raise ValueError('Invalid team size proposed.')
+
+            self.proposed_team[proposal] = actions[proposal]
+            self.phase[proposal] = DISCUSSION if self.discussion else VOTING
+
+        # discussion phase, every seat posts a message to the board, which is
+        # also written into the oldest slot of the history
+        if discussion.any():
+
+            games = np.flatnonzero(discussion)
+
+            if messages is None:
+                posts = np.zeros((len(games), self.num_players, self.max_msg_len), dtype=np.int32)
+            else:
+                posts = np.asarray(messages)[games]
+
+                if posts.min() < 0 or posts.max() >= self.vocab_size:
+                    raise ValueError('Message token outside of the vocabulary.')
+
+            self.message_board[games] = posts
+            self.message_history[games, self.message_cursor[games]] = posts
+            self.message_cursor[games] = (self.message_cursor[games] + 1) % self.message_history_len
+
+            self.phase[games] = VOTING
+
+        # voting phase, all votes processed at once
+        if voting.any():
+
+            self.votes[voting] = actions[voting]
+
+            # if the vote is passed (majority vote accept)
+            passed = voting & (totals > self.num_players / 2)
+            rejected = voting & ~passed
+
+            self.phase[passed] = MISSION
+
+            # Team is rejected; leadership passes to next player
+            self.leader[rejected] = (self.leader[rejected] + 1) % self.num_players
+            self.phase[rejected] = PROPOSAL
+
+        # mission phase, actions are the fail votes of the team
+        if mission.any():
+
+            # round 4 can require two fails to fail the mission
+            fails_required = self.fails_required[self.current_round]
+            failed = mission & (totals >= fails_required)
+            succeeded = mission & ~failed
+
+            self.failed_missions[failed] += 1
+            self.successful_missions[succeeded] += 1
+
+            # Update game state
+            self.current_round[mission] += 1
+            self.leader[mission] = (self.leader[mission] + 1) % self.num_players
+
+            # undo the round update on a 2, 2 draw, as AvalonEnv.step does
+            drawn = mission & (self.successful_missions == 2) & (self.failed_missions == 2)
+            self.current_round[drawn] -= 1
+
+            to_assassination = mission & (self.successful_missions >= 3)
+            evil_win |= mission & (self.failed_missions >= 3)
+
+            self.phase[mission] = PROPOSAL
+            self.phase[to_assassination] = ASSASSINATION
+
+        # assassination phase, all zeros means no guess has been made yet
+        if assassination.any():
+
+            guessed = assassination & (totals > 0)
+
+            kill = guessed & (np.argmax(actions, axis=1) == self.merlin_idx)
+
+            self.assassin_kill[kill] = True
+            evil_win |= kill
+            good_win |= guessed & ~kill
+
+        # terminal rewards, +1 to the winning team, -1 to the losing team
+        terminated = evil_win | good_win
+
+        rewards = np.zeros((self.num_envs, self.num_players), dtype=np.float32)
+        rewards[evil_win] = np.where(self.evil_mask[evil_win], 1, -1)
+        rewards[good_win] = np.where(self.evil_mask[good_win], -1, 1)
+
+        truncated = np.zeros(self.num_envs, dtype=bool)
+
+        info = {
+            'evil_win': evil_win,
+            'assassin_kill': self.assassin_kill & terminated,
+            'roles': self.roles.copy(),
+            'missions': self.successful_missions + self.failed_missions
+        }
+
+        # auto reset the finished games
+        if terminated.any():
+            self.reset_envs(np.flatnonzero(terminated))
+
+        self.mission_size[:] = self.mission_sizes[self.current_round]
+
+        return self.observation, rewards, terminated, truncated, info
+
+
+    def close(self):
+        """
+        Clean up the environment (not used here).
+        """
+        pass